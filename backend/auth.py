@@ -1,10 +1,21 @@
+import asyncio
+import copy
+from concurrent.futures import ThreadPoolExecutor
+from bson import ObjectId
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from passlib.context import CryptContext
+from cache import TTLCache
+from config import settings
+from database import get_database
 
 security = HTTPBearer()
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# 已认证用户的短期缓存；修改角色/状态/删除用户时会立即驱逐，但只驱逐当前 worker 的缓存，
+# 其他 worker 最多在 AUTH_CACHE_TTL_SECONDS 内仍使用旧数据（停用的账号、旧角色），因此 TTL 保持很短
+user_cache = TTLCache(settings.AUTH_CACHE_MAX_ENTRIES, settings.AUTH_CACHE_TTL_SECONDS)
+
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
@@ -16,7 +27,87 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
         # 如果哈希验证失败，尝试直接比较明文密码（向后兼容）
         return plain_password == hashed_password
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+class PasswordHasher:
+    """Runs bcrypt in a dedicated, size-limited thread pool.
+
+    bcrypt releases the GIL while hashing, so the event loop keeps serving other
+    requests; a burst of logins only queues behind other logins. Once
+    `max_pending` jobs are waiting or running, new ones are rejected with 503.
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+
+    async def _run(self, func, *args):
+        # 计数只在事件循环线程里修改，无需加锁
+        if self.in_flight >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server is busy, please try again",
+                headers={"Retry-After": "1"},
+            )
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(get_password_hash, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(verify_password, plain_password, hashed_password)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "in_flight": self.in_flight,
+            "queue_depth": max(self.in_flight - self.workers, 0),
+            "max_in_flight": self.max_in_flight,
+            "completed": self.completed,
+            "rejected": self.rejected
+        }
+
+password_hasher = PasswordHasher(settings.PASSWORD_HASH_WORKERS, settings.PASSWORD_HASH_MAX_PENDING)
+
+async def load_user(user_id: str):
+    """Fetch a user document (without password), served from the short-lived user cache.
+
+    Returns a copy, so callers may modify it without touching the cached entry.
+    """
+    user = user_cache.get(user_id)
+    if user is None:
+        db = get_database()
+        if not ObjectId.is_valid(user_id):
+            return None
+        user = await db.users.find_one({"_id": ObjectId(user_id)}, {"password": 0})
+        if not user:
+            return None
+        user_cache.set(user_id, user)
+    return copy.deepcopy(user)
+
+def evict_user(user_id: str):
+    """Forget a cached user so role/status changes take effect on the next request.
+
+    Only this worker's cache is cleared; other workers pick the change up once
+    their entry expires (AUTH_CACHE_TTL_SECONDS).
+    """
+    user_cache.pop(user_id)
+
+async def get_current_user_doc(credentials: HTTPAuthorizationCredentials = Depends(security)):
     # Simplified: use token directly as user_id
     user_id = credentials.credentials
     if not user_id:
@@ -26,11 +117,9 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    # Check if user is active
-    from database import get_database
-    from bson import ObjectId
-    db = get_database()
-    user = await db.users.find_one({"_id": ObjectId(user_id)})
+    # FastAPI caches dependencies per request, so every dependency built on
+    # this one shares a single lookup
+    user = await load_user(user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -45,16 +134,15 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    return user_id
-
-async def get_current_admin(user_id: str = Depends(get_current_user)):
-    from database import get_database
-    from bson import ObjectId
-    db = get_database()
-    user = await db.users.find_one({"_id": ObjectId(user_id)})
-    if user and user.get("role") == "admin":
-        return user_id
+    return user
+
+async def get_current_user(user: dict = Depends(get_current_user_doc)):
+    return str(user["_id"])
+
+async def get_current_admin(user: dict = Depends(get_current_user_doc)):
+    if user.get("role") == "admin":
+        return str(user["_id"])
     raise HTTPException(
         status_code=status.HTTP_403_FORBIDDEN,
         detail="Not enough permissions"
-    )
\ No newline at end of file
+    )
@@ -0,0 +1,60 @@
+"""Measure event-loop lag while a burst of logins verifies bcrypt passwords.
+
+Compares calling passlib directly inside the coroutine (old behaviour) with
+the bounded password_hasher pool. No database is needed.
+
+Usage: python bench_password_hashing.py [concurrent_logins]
+"""
+from auth import get_password_hash, verify_password, password_hasher
+import asyncio
+import statistics
+import sys
+import time
+
+TICK = 0.01
+
+async def measure_lag(stop: asyncio.Event, lags: list):
+    # 心跳任务：每 10ms 唤醒一次，实际延迟减去预期即为事件循环被阻塞的时间
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append(time.perf_counter() - started - TICK)
+
+async def sync_login(password: str, hashed: str):
+    return verify_password(password, hashed)
+
+async def pooled_login(password: str, hashed: str):
+    return await password_hasher.verify(password, hashed)
+
+async def run(name: str, login, logins: int, hashed: str):
+    stop = asyncio.Event()
+    lags = []
+    ticker = asyncio.create_task(measure_lag(stop, lags))
+    await asyncio.sleep(TICK * 5)
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(login("secret123", hashed) for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await ticker
+    assert all(results)
+
+    lags_ms = sorted(lag * 1000 for lag in lags)
+    p95 = lags_ms[int(len(lags_ms) * 0.95) - 1] if lags_ms else 0
+    print(f'{name}:')
+    print(f'  {logins} logins in {elapsed:.2f}s')
+    print(f'  event-loop lag: max {max(lags_ms):.1f} ms, p95 {p95:.1f} ms, median {statistics.median(lags_ms):.1f} ms')
+    print()
+
+async def main():
+    logins = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    hashed = get_password_hash("secret123")
+    print(f'Pool workers: {password_hasher.workers}\n')
+    await run('Inline bcrypt (blocking)', sync_login, logins, hashed)
+    await run('Password hasher pool', pooled_login, logins, hashed)
+    print(f'Pool stats: {password_hasher.stats()}')
+    password_hasher.shutdown()
+
+if __name__ == '__main__':
+    asyncio.run(main())
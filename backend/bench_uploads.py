@@ -0,0 +1,91 @@
+"""Throughput and event-loop lag for concurrent multi-image uploads.
+
+Compares the old handler body (read the whole upload, blocking write on the
+event loop) with the file stages of uploads.save_upload (hash pass, then a
+chunked copy, each in a worker thread). The reference-count round trip is
+left out so no database is needed; files are written to a temporary directory.
+
+Usage: python bench_uploads.py [requests] [images_per_request] [image_mb]
+"""
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import UploadFile
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import uuid
+import uploads
+
+TICK = 0.01
+
+def make_upload(payload: bytes) -> UploadFile:
+    # 与 multipart 解析结果一致：内容已在临时文件里
+    spool = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    spool.write(payload)
+    spool.seek(0)
+    return UploadFile(spool, size=len(payload), filename="photo.jpg")
+
+async def old_save(images):
+    urls = []
+    for image in images:
+        filename = f"{uuid.uuid4()}.jpg"
+        with open(os.path.join(uploads.UPLOAD_DIR, filename), "wb") as f:
+            content = await image.read()
+            f.write(content)
+        urls.append(f"/uploads/{filename}")
+    return urls
+
+async def new_save(images):
+    urls = []
+    for image in images:
+        digest, _ = await run_in_threadpool(uploads._hash, image.file, 1 << 40)
+        filename = f"{digest}.jpg"
+        if not os.path.exists(os.path.join(uploads.UPLOAD_DIR, filename)):
+            await run_in_threadpool(uploads._copy, image.file, filename)
+        urls.append(f"/uploads/{filename}")
+    return urls
+
+async def measure_lag(stop: asyncio.Event, lags: list):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append(time.perf_counter() - started - TICK)
+
+async def run(name, save, requests, per_request, payloads):
+    batches = [[make_upload(next(payloads)) for _ in range(per_request)] for _ in range(requests)]
+    size = batches[0][0].size
+    stop = asyncio.Event()
+    lags = []
+    ticker = asyncio.create_task(measure_lag(stop, lags))
+    await asyncio.sleep(TICK * 5)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(save(batch) for batch in batches))
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await ticker
+    total_mb = requests * per_request * size / (1024 * 1024)
+    print(f'{name}:')
+    print(f'  {requests} requests x {per_request} images, {total_mb:.0f} MB in {elapsed:.2f}s ({total_mb / elapsed:.0f} MB/s)')
+    print(f'  event-loop lag: max {max(lags) * 1000:.1f} ms')
+    print()
+
+async def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    per_request = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    image_mb = float(sys.argv[3]) if len(sys.argv) > 3 else 4
+    size = int(image_mb * 1024 * 1024)
+
+    with tempfile.TemporaryDirectory() as directory:
+        uploads.UPLOAD_DIR = directory
+        distinct = lambda: iter(lambda: os.urandom(size), None)
+        await run('Read whole file + blocking write', old_save, requests, per_request, distinct())
+        await run('Hash + chunked copy in worker threads', new_save, requests, per_request, distinct())
+        # 同一张图重复上传：按内容命名后只写一次
+        same = os.urandom(size)
+        await run('Same, every image with identical bytes', new_save, requests, per_request, iter(lambda: same, None))
+
+if __name__ == '__main__':
+    asyncio.run(main())
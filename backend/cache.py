@@ -0,0 +1,146 @@
+import time
+import unicodedata
+from collections import OrderedDict
+from config import settings
+
+class TTLCache:
+    """Size-bounded LRU cache whose entries also expire after `ttl` seconds"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        entry = self._data.get(key)
+        return entry is not None and entry[0] > time.monotonic()
+
+    def get(self, key, default=None):
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key, default=None):
+        entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def items(self):
+        """Snapshot of live (key, value) pairs; does not affect LRU order or counters"""
+        now = time.monotonic()
+        return [(key, value) for key, (expires_at, value) in list(self._data.items()) if expires_at > now]
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0
+        }
+
+def normalize_search(search):
+    if not search:
+        return None
+    return " ".join(unicodedata.normalize("NFKC", search).lower().split()) or None
+
+class CatalogCache:
+    """Cache for the public catalog endpoints.
+
+    List entries remember their filters and the product ids they returned, so a
+    product write only drops the entries it can affect.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.lists = TTLCache(maxsize, ttl)
+        self.products = TTLCache(maxsize, ttl)
+
+    @staticmethod
+    def list_key(**params) -> tuple:
+        params["search"] = normalize_search(params.get("search"))
+        return tuple(sorted(params.items()))
+
+    def get_list(self, key: tuple):
+        entry = self.lists.get(key)
+        return None if entry is None else entry["value"]
+
+    def set_list(self, key: tuple, value, product_ids):
+        self.lists.set(key, {"params": dict(key), "product_ids": set(product_ids), "value": value})
+
+    def get_product(self, product_id: str):
+        return self.products.get(product_id)
+
+    def set_product(self, product_id: str, value):
+        self.products.set(product_id, value)
+
+    @staticmethod
+    def _matches(params: dict, product: dict) -> bool:
+        # 商品（现在）是否可能出现在该列表里；带搜索词的列表无法廉价判断，一律视为受影响
+        if product.get("status") != "approved":
+            return False
+        if params.get("category") and product.get("category") != params["category"]:
+            return False
+        price = product.get("price")
+        if params.get("min_price") is not None and price is not None and price < params["min_price"]:
+            return False
+        if params.get("max_price") is not None and price is not None and price > params["max_price"]:
+            return False
+        return True
+
+    def invalidate_product(self, product_id: str, product: dict = None):
+        """Drop cached entries a write to this product can affect.
+
+        `product` is the product as it is after the write (or before a delete);
+        lists it now matches are dropped along with lists that contained it.
+        """
+        self.products.pop(product_id)
+        for key, entry in self.lists.items():
+            if product_id in entry["product_ids"] or (product is not None and self._matches(entry["params"], product)):
+                self.lists.pop(key)
+
+    def invalidate_products(self, products: dict):
+        """invalidate_product for many products (id -> product after the write) in one pass over the lists"""
+        for product_id in products:
+            self.products.pop(product_id)
+        for key, entry in self.lists.items():
+            if any(
+                product_id in entry["product_ids"] or (product is not None and self._matches(entry["params"], product))
+                for product_id, product in products.items()
+            ):
+                self.lists.pop(key)
+
+    def clear(self):
+        self.lists.clear()
+        self.products.clear()
+
+    def stats(self) -> dict:
+        return {"lists": self.lists.stats(), "products": self.products.stats()}
+
+catalog_cache = CatalogCache(settings.CATALOG_CACHE_MAX_ENTRIES, settings.CATALOG_CACHE_TTL_SECONDS)
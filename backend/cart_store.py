@@ -0,0 +1,315 @@
+import asyncio
+from collections import OrderedDict
+from datetime import datetime
+from pymongo import DeleteOne, UpdateOne, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from database import get_database
+from checkout import merge_quantities
+from config import settings
+
+class MongoCartStore:
+    """Carts read and written straight through to MongoDB"""
+
+    engine = "mongo"
+
+    async def get(self, user_id: str):
+        db = get_database()
+        return await db.carts.find_one({"user_id": user_id})
+
+    async def add_item(self, user_id: str, item: dict) -> dict:
+        """Add an item (or its quantity) to the cart in one atomic upsert"""
+        db = get_database()
+        product_id = {"$literal": item["product_id"]}
+        # 更新管道：已有该商品则累加数量，否则追加一行；购物车不存在时由 upsert 创建
+        # 用户输入一律包在 $literal 里，避免以 $ 开头的字符串被当作表达式
+        pipeline = [{"$set": {
+            "created_at": {"$ifNull": ["$created_at", datetime.utcnow()]},
+            "items": {"$cond": [
+                {"$in": [product_id, {"$ifNull": ["$items.product_id", []]}]},
+                {"$map": {
+                    "input": "$items",
+                    "as": "item",
+                    "in": {"$cond": [
+                        {"$eq": ["$$item.product_id", product_id]},
+                        {"$mergeObjects": ["$$item", {"quantity": {"$add": ["$$item.quantity", item["quantity"]]}}]},
+                        "$$item"
+                    ]}
+                }},
+                {"$concatArrays": [{"$ifNull": ["$items", []]}, [{"$literal": item}]]}
+            ]}
+        }}]
+        try:
+            return await db.carts.find_one_and_update(
+                {"user_id": user_id}, pipeline, upsert=True, return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # 两个请求同时创建购物车时，唯一索引只让一个插入成功；另一个重试即为普通更新
+            return await db.carts.find_one_and_update(
+                {"user_id": user_id}, pipeline, return_document=ReturnDocument.AFTER
+            )
+
+    async def set_quantity(self, user_id: str, product_id: str, quantity: int):
+        """Set an item's quantity (removing it when quantity <= 0); None if there is no cart"""
+        if quantity <= 0:
+            return await self.remove_item(user_id, product_id)
+
+        db = get_database()
+        return await db.carts.find_one_and_update(
+            {"user_id": user_id},
+            {"$set": {"items.$[item].quantity": quantity}},
+            array_filters=[{"item.product_id": product_id}],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def remove_item(self, user_id: str, product_id: str):
+        """Remove an item; None if there is no cart"""
+        db = get_database()
+        return await db.carts.find_one_and_update(
+            {"user_id": user_id},
+            {"$pull": {"items": {"product_id": product_id}}},
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def clear(self, user_id: str):
+        db = get_database()
+        await db.carts.delete_one({"user_id": user_id})
+
+    async def remove_ordered(self, user_id: str, items: list, cleared: bool):
+        """Take ordered quantities out of the cart after checkout, dropping lines that reach zero.
+
+        `cleared` says the order already deleted the cart because it was
+        unchanged; otherwise items added while checking out are kept.
+        """
+        if cleared:
+            return
+        db = get_database()
+        ordered = {"$switch": {
+            "branches": [
+                {"case": {"$eq": ["$$item.product_id", {"$literal": product_id}]}, "then": quantity}
+                for product_id, quantity in merge_quantities(items).items()
+            ],
+            "default": 0
+        }}
+        pipeline = [{"$set": {"items": {"$filter": {
+            "input": {"$map": {
+                "input": {"$ifNull": ["$items", []]},
+                "as": "item",
+                "in": {"$mergeObjects": ["$$item", {"quantity": {"$subtract": ["$$item.quantity", ordered]}}]}
+            }},
+            "as": "item",
+            "cond": {"$gt": ["$$item.quantity", 0]}
+        }}}}]
+        await db.carts.update_one({"user_id": user_id}, pipeline)
+        await db.carts.delete_one({"user_id": user_id, "items": {"$size": 0}})
+
+    async def flush(self, user_id: str = None) -> int:
+        return 0
+
+    def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    def stats(self) -> dict:
+        return {"engine": self.engine}
+
+class WriteBehindCartStore(MongoCartStore):
+    """Keeps hot carts in process memory and writes them back to MongoDB in batches.
+
+    Reads are served from memory once a cart is loaded. Mutations only mark the
+    cart dirty; a background task flushes the latest state of every dirty cart
+    in one bulk write per interval, so several clicks on the same cart cost a
+    single write. Memory is only authoritative within one process: run a single
+    worker (or sticky sessions) when this engine is enabled.
+    """
+
+    engine = "memory"
+
+    def __init__(self, max_carts: int, flush_interval: float):
+        self.max_carts = max_carts
+        self.flush_interval = flush_interval
+        # user_id -> 购物车（None 表示该用户没有购物车）
+        self._carts = OrderedDict()
+        self._dirty = set()
+        self._task = None
+        self.hits = 0
+        self.misses = 0
+        self.flushes = 0
+        self.flushed_carts = 0
+        self.flush_errors = 0
+
+    def _remember(self, user_id: str, cart):
+        self._carts[user_id] = cart
+        self._carts.move_to_end(user_id)
+        # 只淘汰已落库的购物车；脏数据等下一次 flush 后再淘汰
+        while len(self._carts) > self.max_carts:
+            victim = next((key for key in self._carts if key not in self._dirty), None)
+            if victim is None:
+                break
+            del self._carts[victim]
+
+    async def get(self, user_id: str):
+        if user_id in self._carts:
+            self.hits += 1
+            self._carts.move_to_end(user_id)
+            return self._carts[user_id]
+
+        self.misses += 1
+        cart = await super().get(user_id)
+        # 加载期间可能已有并发请求写入了内存，以内存中的为准
+        if user_id in self._carts:
+            return self._carts[user_id]
+        if cart is not None:
+            cart = {"user_id": user_id, "items": cart.get("items", []), "created_at": cart.get("created_at")}
+        self._remember(user_id, cart)
+        return cart
+
+    def _mark_dirty(self, user_id: str, cart):
+        self._remember(user_id, cart)
+        self._dirty.add(user_id)
+
+    async def add_item(self, user_id: str, item: dict) -> dict:
+        cart = await self.get(user_id)
+        if cart is None:
+            cart = {"user_id": user_id, "items": [], "created_at": datetime.utcnow()}
+
+        existing_item = next((i for i in cart["items"] if i["product_id"] == item["product_id"]), None)
+        if existing_item:
+            existing_item["quantity"] += item["quantity"]
+        else:
+            cart["items"].append(dict(item))
+
+        self._mark_dirty(user_id, cart)
+        return cart
+
+    async def set_quantity(self, user_id: str, product_id: str, quantity: int):
+        cart = await self.get(user_id)
+        if cart is None:
+            return None
+
+        if quantity <= 0:
+            cart["items"] = [i for i in cart["items"] if i["product_id"] != product_id]
+        else:
+            for i in cart["items"]:
+                if i["product_id"] == product_id:
+                    i["quantity"] = quantity
+                    break
+
+        self._mark_dirty(user_id, cart)
+        return cart
+
+    async def remove_item(self, user_id: str, product_id: str):
+        return await self.set_quantity(user_id, product_id, 0)
+
+    async def clear(self, user_id: str):
+        self._mark_dirty(user_id, None)
+
+    async def remove_ordered(self, user_id: str, items: list, cleared: bool):
+        cart = await self.get(user_id)
+        if cart is None:
+            return
+
+        quantities = merge_quantities(items)
+        remaining = []
+        for item in cart["items"]:
+            taken = min(item["quantity"], quantities.get(item["product_id"], 0))
+            quantities[item["product_id"]] = quantities.get(item["product_id"], 0) - taken
+            if item["quantity"] > taken:
+                remaining.append({**item, "quantity": item["quantity"] - taken})
+
+        if remaining:
+            # 下单期间加入的商品留在购物车里，下一次 flush 写回
+            cart["items"] = remaining
+            self._mark_dirty(user_id, cart)
+        elif cleared:
+            # 数据库中的购物车已随订单删除，内存里也不再有待写的改动
+            self._dirty.discard(user_id)
+            self._remember(user_id, None)
+        else:
+            self._mark_dirty(user_id, None)
+
+    async def flush(self, user_id: str = None) -> int:
+        """Write dirty carts (or just this user's) to MongoDB; returns how many were written"""
+        user_ids = [user_id] if user_id is not None else list(self._dirty)
+        user_ids = [key for key in user_ids if key in self._dirty]
+        if not user_ids:
+            return 0
+
+        operations = []
+        for key in user_ids:
+            cart = self._carts.get(key)
+            if cart is None:
+                operations.append(DeleteOne({"user_id": key}))
+            else:
+                # 复制一份，避免写库期间的并发修改影响本次写入的内容
+                operations.append(UpdateOne(
+                    {"user_id": key},
+                    {
+                        "$set": {"items": [dict(i) for i in cart["items"]]},
+                        "$setOnInsert": {"created_at": cart.get("created_at") or datetime.utcnow()}
+                    },
+                    upsert=True
+                ))
+
+        # 先清除脏标记：写库期间的新修改会重新标脏，留给下一轮
+        self._dirty.difference_update(user_ids)
+        try:
+            db = get_database()
+            await db.carts.bulk_write(operations, ordered=False)
+        except Exception as e:
+            self._dirty.update(user_ids)
+            self.flush_errors += 1
+            print(f"Error flushing {len(user_ids)} carts: {e}")
+            return 0
+
+        self.flushes += 1
+        self.flushed_carts += len(user_ids)
+        return len(user_ids)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the flush loop and write everything still pending"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        flushed = await self.flush()
+        if flushed:
+            print(f"Flushed {flushed} carts on shutdown")
+        if self._dirty:
+            print(f"Warning: {len(self._dirty)} carts could not be written to MongoDB")
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "engine": self.engine,
+            "carts": len(self._carts),
+            "max_carts": self.max_carts,
+            "dirty": len(self._dirty),
+            "flush_interval_seconds": self.flush_interval,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0,
+            "flushes": self.flushes,
+            "flushed_carts": self.flushed_carts,
+            "flush_errors": self.flush_errors
+        }
+
+def create_cart_store():
+    if settings.CART_STORE == "memory":
+        return WriteBehindCartStore(settings.CART_STORE_MAX_CARTS, settings.CART_FLUSH_INTERVAL_SECONDS)
+    return MongoCartStore()
+
+cart_store = create_cart_store()
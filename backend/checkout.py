@@ -0,0 +1,137 @@
+import asyncio
+import time
+from bson import ObjectId
+from pymongo import UpdateOne
+from database import client, get_database
+
+class InsufficientStockError(Exception):
+    def __init__(self, product_ids: list):
+        super().__init__(f"Insufficient stock for products: {', '.join(product_ids)}")
+        self.product_ids = product_ids
+
+# 是否支持事务（副本集 / mongos），首次下单时检测；只缓存成功的检测结果
+_transactions_supported = None
+# 检测失败（例如启动时数据库短暂不可用）后，隔一段时间再试，期间按不支持处理
+PROBE_RETRY_SECONDS = 30
+_probe_retry_at = 0.0
+
+async def supports_transactions() -> bool:
+    global _transactions_supported, _probe_retry_at
+    if _transactions_supported is not None:
+        return _transactions_supported
+    if time.monotonic() < _probe_retry_at:
+        return False
+    try:
+        hello = await client.admin.command("hello")
+    except Exception as e:
+        print(f"Error checking transaction support, retrying in {PROBE_RETRY_SECONDS}s: {e}")
+        _probe_retry_at = time.monotonic() + PROBE_RETRY_SECONDS
+        return False
+    _transactions_supported = "setName" in hello or hello.get("msg") == "isdbgrid"
+    return _transactions_supported
+
+def merge_quantities(items: list) -> dict:
+    # 同一商品可能在购物车里出现多行，按商品合并数量
+    quantities = {}
+    for item in items:
+        product_id = str(item["product_id"])
+        quantities[product_id] = quantities.get(product_id, 0) + item["quantity"]
+    return quantities
+
+def _reserve_updates(quantities: dict) -> list:
+    # 条件扣减：库存不足时不匹配，也就不会扣成负数
+    return [
+        ({"_id": ObjectId(product_id), "stock": {"$gte": quantity}}, {"$inc": {"stock": -quantity}})
+        for product_id, quantity in quantities.items()
+    ]
+
+async def release_stock(quantities: dict):
+    """Give reserved quantities back to their products"""
+    if not quantities:
+        return
+    db = get_database()
+    await db.products.bulk_write(
+        [
+            UpdateOne({"_id": ObjectId(product_id)}, {"$inc": {"stock": quantity}})
+            for product_id, quantity in quantities.items()
+        ],
+        ordered=False
+    )
+
+async def _unavailable(quantities: dict) -> list:
+    db = get_database()
+    object_ids = [ObjectId(product_id) for product_id in quantities]
+    products = await db.products.find({"_id": {"$in": object_ids}}, {"stock": 1}).to_list(length=len(object_ids))
+    stock = {str(product["_id"]): product.get("stock", 0) for product in products}
+    return [product_id for product_id, quantity in quantities.items() if stock.get(product_id, 0) < quantity]
+
+def _ordered_cart(order: dict) -> dict:
+    # 购物车仍与下单时的内容完全一致才整个删除；下单期间加入的商品留给调用方处理
+    return {"user_id": order["user_id"], "items": order["items"]}
+
+async def _place_in_transaction(order: dict, quantities: dict):
+    db = get_database()
+
+    async def callback(session):
+        result = await db.products.bulk_write(
+            [UpdateOne(query, update) for query, update in _reserve_updates(quantities)],
+            ordered=False,
+            session=session
+        )
+        if result.matched_count != len(quantities):
+            # 抛出异常会中止事务，所有扣减一起回滚
+            raise InsufficientStockError(list(quantities))
+        await db.orders.insert_one(order, session=session)
+        result = await db.carts.delete_one(_ordered_cart(order), session=session)
+        return result.deleted_count == 1
+
+    try:
+        async with await client.start_session() as session:
+            return await session.with_transaction(callback)
+    except InsufficientStockError:
+        raise InsufficientStockError(await _unavailable(quantities))
+
+async def _place_with_compensation(order: dict, quantities: dict):
+    db = get_database()
+    # 单机部署没有事务：并发执行条件扣减，每个结果都能确定成功与否，失败时精确回滚
+    results = await asyncio.gather(*(
+        db.products.update_one(query, update) for query, update in _reserve_updates(quantities)
+    ))
+    reserved = {}
+    failed = []
+    for (product_id, quantity), result in zip(quantities.items(), results):
+        if result.modified_count:
+            reserved[product_id] = quantity
+        else:
+            failed.append(product_id)
+
+    if failed:
+        await release_stock(reserved)
+        raise InsufficientStockError(failed)
+
+    try:
+        await db.orders.insert_one(order)
+    except Exception:
+        await release_stock(reserved)
+        raise
+    result = await db.carts.delete_one(_ordered_cart(order))
+    return result.deleted_count == 1
+
+async def place_order(order: dict) -> bool:
+    """Reserve stock for every line item and store the order.
+
+    Either all items are reserved and the order is inserted, or nothing is
+    changed and InsufficientStockError lists the products that ran short.
+    Uses a transaction when the deployment supports one. The user's cart is
+    deleted with it only while it still holds exactly the ordered items;
+    returns whether it was.
+    """
+    quantities = merge_quantities(order["items"])
+    invalid = [product_id for product_id in quantities if not ObjectId.is_valid(product_id)]
+    if invalid:
+        raise InsufficientStockError(invalid)
+
+    order.setdefault("_id", ObjectId())
+    if await supports_transactions():
+        return await _place_in_transaction(order, quantities)
+    return await _place_with_compensation(order, quantities)
@@ -8,6 +8,39 @@ class Settings(BaseSettings):
     SECRET_KEY: str = "your-secret-key-change-this-in-production"
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    CATALOG_CACHE_TTL_SECONDS: float = 30
+    CATALOG_CACHE_MAX_ENTRIES: int = 1024
+    AUTH_CACHE_TTL_SECONDS: float = 10
+    AUTH_CACHE_MAX_ENTRIES: int = 10000
+    FAVORITE_CACHE_ENABLED: bool = True
+    FAVORITE_CACHE_TTL_SECONDS: float = 60
+    FAVORITE_CACHE_MAX_ENTRIES: int = 10000
+    REVIEW_SUMMARY_CACHE_TTL_SECONDS: float = 60
+    REVIEW_SUMMARY_CACHE_MAX_ENTRIES: int = 1024
+    # "mongo" 直接读写数据库；"memory" 为进程内写回缓存（仅适用于单 worker）
+    # 每个 worker 各自定期重建搜索索引，以看到其他 worker 的商品改动（0 = 不重建）
+    SEARCH_INDEX_REFRESH_SECONDS: float = 300
+    CART_STORE: str = "mongo"
+    CART_STORE_MAX_CARTS: int = 10000
+    CART_FLUSH_INTERVAL_SECONDS: float = 2
+    UPLOAD_MAX_FILE_BYTES: int = 10 * 1024 * 1024
+    UPLOAD_MAX_REQUEST_BYTES: int = 30 * 1024 * 1024
+    IMAGE_WORKERS: int = 2
+    STATIC_HOT_CACHE_BYTES: int = 0
+    STATIC_HOT_CACHE_MAX_FILE_BYTES: int = 256 * 1024
+    EXPORT_MAX_CONCURRENT: int = 2
+    EXPORT_BATCH_SIZE: int = 500
+    EXPORT_BATCH_PAUSE_SECONDS: float = 0.01
+    # 后台维护任务：多个 worker 通过 jobs 集合中的租约保证同一任务只运行一份
+    SCHEDULER_ENABLED: bool = True
+    SCHEDULER_POLL_SECONDS: float = 30
+    JOB_LEASE_SECONDS: float = 300
+    JOB_BATCH_PAUSE_SECONDS: float = 0.2
+    # 清理会删除用户、商品和订单：默认只在管理员触发时运行，设为正数才定时运行
+    CLEANUP_INTERVAL_SECONDS: float = 0
+    CLEANUP_BATCH_SIZE: int = 200
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_MAX_PENDING: int = 64
     
     class Config:
         env_file = ".env"
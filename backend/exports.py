@@ -0,0 +1,187 @@
+import asyncio
+import csv
+import io
+import json
+from datetime import datetime
+from fastapi import HTTPException, status
+from fastapi.responses import StreamingResponse
+from config import settings
+
+EXPORT_FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson"
+}
+
+ORDER_EXPORT_FIELDS = [
+    "order_id", "order_number", "user_id", "status", "created_at", "paid_at", "payment_method",
+    "total_price", "shipping_address", "shipping_city", "shipping_postal_code", "shipping_country",
+    "shipping_phone", "product_id", "product_name", "price", "quantity", "line_total"
+]
+
+PRODUCT_EXPORT_FIELDS = [
+    "product_id", "name", "category", "price", "stock", "status", "is_pinned", "seller_id",
+    "rating", "num_reviews", "created_at"
+]
+
+def order_rows(order: dict):
+    """One row per line item; an order without items still gets one row"""
+    address = order.get("shipping_address") or {}
+    base = {
+        "order_id": str(order["_id"]),
+        "order_number": order.get("order_number", ""),
+        "user_id": str(order.get("user_id", "")),
+        "status": order.get("status", ""),
+        "created_at": order.get("created_at"),
+        "paid_at": order.get("paidAt"),
+        "payment_method": order.get("payment_method", ""),
+        "total_price": order.get("total_price", 0),
+        "shipping_address": address.get("address", ""),
+        "shipping_city": address.get("city", ""),
+        "shipping_postal_code": address.get("postalCode", ""),
+        "shipping_country": address.get("country", ""),
+        "shipping_phone": address.get("phone", "")
+    }
+    items = order.get("items") or [{}]
+    for item in items:
+        price = item.get("price")
+        quantity = item.get("quantity")
+        yield {
+            **base,
+            "product_id": str(item.get("product_id", "")),
+            "product_name": item.get("name", ""),
+            "price": price,
+            "quantity": quantity,
+            "line_total": price * quantity if price is not None and quantity is not None else None
+        }
+
+def product_rows(product: dict):
+    yield {
+        "product_id": str(product["_id"]),
+        "name": product.get("name", ""),
+        "category": product.get("category", ""),
+        "price": product.get("price", 0),
+        "stock": product.get("stock", 0),
+        "status": product.get("status", "pending"),
+        "is_pinned": product.get("is_pinned", False),
+        "seller_id": str(product.get("seller_id", "")),
+        "rating": product.get("rating", 0),
+        "num_reviews": product.get("numReviews", 0),
+        "created_at": product.get("created_at")
+    }
+
+# 以这些字符开头的单元格会被 Excel 当作公式执行
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+def _value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+def _csv_value(value):
+    value = _value(value)
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+class ExportResponse(StreamingResponse):
+    """Streaming response that frees its export slot once it is done or abandoned"""
+
+    def __init__(self, *args, release, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._release = release
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self._release()
+
+class ExportThrottle:
+    """Bounds how much of the server exports may use.
+
+    At most `max_concurrent` exports run at once (more are rejected with 503),
+    documents are read `batch_size` at a time, and the stream pauses between
+    batches so regular requests keep getting the event loop and the database.
+    """
+
+    def __init__(self, max_concurrent: int, batch_size: int, pause_seconds: float):
+        self.max_concurrent = max_concurrent
+        self.batch_size = batch_size
+        self.pause_seconds = pause_seconds
+        self.active = 0
+        self.completed = 0
+        self.rejected = 0
+        self.rows = 0
+
+    def _reserve(self):
+        # 检查与占用之间没有 await，并发的导出请求不会同时通过
+        if self.active >= self.max_concurrent:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many exports in progress, please try again later",
+                headers={"Retry-After": "30"},
+            )
+        self.active += 1
+
+    def _release(self):
+        self.active -= 1
+
+    async def stream(self, cursor, to_rows, fields: list, export_format: str):
+        """Encode documents from a Motor cursor chunk by chunk"""
+        try:
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, fieldnames=fields, extrasaction="ignore")
+            if export_format == "csv":
+                # BOM 让 Excel 正确识别 UTF-8 中文
+                buffer.write("\ufeff")
+                writer.writeheader()
+
+            count = 0
+            async for document in cursor.batch_size(self.batch_size):
+                for row in to_rows(document):
+                    if export_format == "csv":
+                        writer.writerow({field: _csv_value(row.get(field)) for field in fields})
+                    else:
+                        row = {field: _value(row.get(field)) for field in fields}
+                        buffer.write(json.dumps(row, ensure_ascii=False, default=str))
+                        buffer.write("\n")
+                    self.rows += 1
+                count += 1
+                # 每批输出一次并让出事件循环，内存只占一批数据
+                if count % self.batch_size == 0:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+                    await asyncio.sleep(self.pause_seconds)
+            yield buffer.getvalue()
+            self.completed += 1
+        finally:
+            await cursor.close()
+
+    def response(self, cursor, to_rows, fields: list, export_format: str, name: str) -> StreamingResponse:
+        """Take an export slot (or raise 503) and stream the export in a response that frees it"""
+        self._reserve()
+        filename = f"{name}-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.{export_format}"
+        return ExportResponse(
+            self.stream(cursor, to_rows, fields, export_format),
+            media_type=EXPORT_FORMATS[export_format],
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+            release=self._release
+        )
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "batch_size": self.batch_size,
+            "active": self.active,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "rows": self.rows
+        }
+
+export_throttle = ExportThrottle(
+    settings.EXPORT_MAX_CONCURRENT,
+    settings.EXPORT_BATCH_SIZE,
+    settings.EXPORT_BATCH_PAUSE_SECONDS
+)
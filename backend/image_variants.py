@@ -0,0 +1,136 @@
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from bson import ObjectId
+from config import settings
+from database import get_database
+from cache import catalog_cache
+import uploads
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    # 未安装 Pillow 时不生成缩略图，列表继续使用原图
+    Image = None
+
+# 生成的宽度（像素），最小的一档 WebP 用作列表缩略图
+VARIANT_WIDTHS = (160, 480, 960)
+VARIANT_FORMATS = (("webp", "WEBP"), ("jpg", "JPEG"))
+QUALITY = 80
+
+_executor = None
+
+def _variant_name(filename: str, width: int, extension: str) -> str:
+    return f"{os.path.splitext(filename)[0]}_w{width}.{extension}"
+
+def _generate(directory: str, filename: str) -> list:
+    """Write width/format variants of one image; runs in a worker process"""
+    with Image.open(os.path.join(directory, filename)) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+
+        variants = []
+        for width in VARIANT_WIDTHS:
+            # 不放大：原图比这一档还窄时只保留到原图宽度为止
+            if width > image.width and variants:
+                break
+            resized = image.copy()
+            resized.thumbnail((width, width * 10))
+            for extension, image_format in VARIANT_FORMATS:
+                variant = resized.convert("RGB") if image_format == "JPEG" else resized
+                name = _variant_name(filename, width, extension)
+                temp_path = os.path.join(directory, f".{name}.tmp")
+                variant.save(temp_path, image_format, quality=QUALITY)
+                os.replace(temp_path, os.path.join(directory, name))
+                variants.append({
+                    "width": resized.width,
+                    "format": extension,
+                    "url": f"{uploads.UPLOAD_URL_PREFIX}{name}"
+                })
+        return variants
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=settings.IMAGE_WORKERS)
+    return _executor
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+def variant_sources(product: dict) -> list:
+    """Image URLs of a product to build variants for, main image first"""
+    urls = [product.get("image")] + list(product.get("images") or [])
+    return [url for url in dict.fromkeys(urls) if url and url.startswith(uploads.UPLOAD_URL_PREFIX)]
+
+def _files_exist(variants: list) -> bool:
+    return all(
+        os.path.exists(os.path.join(uploads.UPLOAD_DIR, os.path.basename(variant["url"])))
+        for variant in variants
+    )
+
+def thumbnail_url(variants: list):
+    webp = [variant for variant in variants if variant["format"] == "webp"]
+    return min(webp, key=lambda variant: variant["width"])["url"] if webp else None
+
+async def generate_product_variants(product_id: str, image_urls: list):
+    """Build resized/WebP variants for a product's uploaded images and record them.
+
+    Meant to run as a background task after a product is created or its images
+    change: the work happens in a process pool and the product gets
+    `image_variants` (one entry per source image) and `thumbnail` (smallest WebP
+    of the main image).
+    """
+    if Image is None or not image_urls:
+        return
+
+    loop = asyncio.get_running_loop()
+    db = get_database()
+    image_variants = []
+    for url in image_urls:
+        if not url.startswith(uploads.UPLOAD_URL_PREFIX):
+            continue
+        # 相同内容的图片文件名相同，别的商品已生成过的变体直接复用
+        existing = await db.products.find_one({"image_variants.source": url}, {"image_variants": 1})
+        if existing:
+            entry = next(entry for entry in existing["image_variants"] if entry["source"] == url)
+            # 文件可能已随原图被回收，确认还在再复用，否则重新生成
+            if _files_exist(entry["variants"]):
+                image_variants.append(entry)
+                continue
+        try:
+            variants = await loop.run_in_executor(
+                _get_executor(), _generate, uploads.UPLOAD_DIR, os.path.basename(url)
+            )
+        except Exception as e:
+            print(f"Error generating variants for {url}: {e}")
+            continue
+        image_variants.append({"source": url, "variants": variants})
+
+    if not image_variants:
+        return
+
+    # 生成期间图片可能又被修改：只记录商品仍在引用（也就仍持有引用计数）的原图的变体，
+    # 且仅当图片字段与读到的一致时写入；不一致说明那次修改已安排了自己的生成任务
+    current = await db.products.find_one({"_id": ObjectId(product_id)}, {"image": 1, "images": 1})
+    sources = variant_sources(current) if current else []
+    await uploads.discard_variants([entry["source"] for entry in image_variants if entry["source"] not in sources])
+    image_variants = [entry for entry in image_variants if entry["source"] in sources]
+    if not image_variants:
+        return
+
+    update = {"image_variants": image_variants}
+    if image_variants[0]["source"] == sources[0]:
+        update["thumbnail"] = thumbnail_url(image_variants[0]["variants"])
+
+    product = await db.products.find_one_and_update(
+        {"_id": ObjectId(product_id), "image": current.get("image"), "images": current.get("images")},
+        {"$set": update},
+        projection={"status": 1, "category": 1, "price": 1}
+    )
+    if product:
+        catalog_cache.invalidate_product(product_id, product)
@@ -0,0 +1,147 @@
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from database import get_database
+
+# 路由查询依赖的索引声明：集合名 -> 索引列表
+# 索引名固定，便于启动时幂等创建以及漂移检测
+INDEXES = {
+    "products": [
+        # 列表按 (is_pinned, created_at, _id) 倒序做游标分页
+        IndexModel(
+            [("status", ASCENDING), ("is_pinned", DESCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+            name="status_pinned_created_id"
+        ),
+        IndexModel(
+            [("is_pinned", DESCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+            name="pinned_created_id"
+        ),
+        IndexModel(
+            [("seller_id", ASCENDING), ("is_pinned", DESCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+            name="seller_pinned_created_id"
+        ),
+        # 相同内容的图片复用已生成的缩略图
+        IndexModel([("image_variants.source", ASCENDING)], name="image_variant_source"),
+    ],
+    "carts": [
+        IndexModel([("user_id", ASCENDING)], name="user_id_unique", unique=True),
+    ],
+    "orders": [
+        # 订单列表按 (created_at, _id) 倒序做游标分页，可按用户 / 状态筛选；
+        # created_id 同时支撑仪表盘按时间范围统计
+        IndexModel(
+            [("user_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+            name="user_created_id"
+        ),
+        IndexModel(
+            [("status", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+            name="status_created_id"
+        ),
+        IndexModel([("created_at", DESCENDING), ("_id", DESCENDING)], name="created_id"),
+    ],
+    "reviews": [
+        # 商品评论按时间 / 有用数游标分页；也覆盖按 product_id 的普通查询
+        IndexModel(
+            [("product_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+            name="product_created_id"
+        ),
+        IndexModel(
+            [("product_id", ASCENDING), ("helpful_count", DESCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+            name="product_helpful_created_id"
+        ),
+    ],
+    "review_helpful": [
+        IndexModel(
+            [("review_id", ASCENDING), ("user_id", ASCENDING)],
+            name="review_user_unique",
+            unique=True
+        ),
+    ],
+    "favorites": [
+        IndexModel(
+            [("user_id", ASCENDING), ("product_id", ASCENDING)],
+            name="user_product_unique",
+            unique=True
+        ),
+    ],
+    "users": [
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+    ],
+}
+
+def _declared_spec(index: IndexModel) -> dict:
+    document = index.document
+    return {
+        "key": list(document["key"].items()),
+        "unique": bool(document.get("unique", False))
+    }
+
+def _existing_spec(info: dict) -> dict:
+    return {
+        # shell 创建的索引方向可能是浮点数 1.0
+        "key": [
+            (field, int(direction) if isinstance(direction, float) else direction)
+            for field, direction in info["key"]
+        ],
+        "unique": bool(info.get("unique", False))
+    }
+
+async def ensure_indexes():
+    """Create declared indexes, one at a time so a single failure does not block the rest"""
+    db = get_database()
+    for collection_name, indexes in INDEXES.items():
+        for index in indexes:
+            try:
+                await db[collection_name].create_indexes([index])
+            except Exception as e:
+                # 例如已有重复数据导致唯一索引无法创建，记录后继续启动
+                print(f"Error creating index {collection_name}.{index.document['name']}: {e}")
+
+# 游标分页要求排序字段在每个文档上都存在，按值筛选的字段也补上默认值：集合名 -> (字段, 默认值)
+SORT_KEY_DEFAULTS = [
+    ("products", "is_pinned", False),
+    ("products", "status", "pending"),
+    ("reviews", "helpful_count", 0),
+]
+
+async def backfill_sort_keys():
+    """Give every document an explicit value for its sort keys (and product status) so queries can compare them"""
+    db = get_database()
+    for collection_name, field, default in SORT_KEY_DEFAULTS:
+        try:
+            result = await db[collection_name].update_many(
+                {field: {"$exists": False}},
+                {"$set": {field: default}}
+            )
+            if result.modified_count:
+                print(f"Backfilled {field} on {result.modified_count} {collection_name}")
+        except Exception as e:
+            print(f"Error backfilling {collection_name}.{field}: {e}")
+
+async def get_index_drift():
+    """Compare declared indexes with what the database actually has"""
+    db = get_database()
+    drift = {}
+    for collection_name, indexes in INDEXES.items():
+        existing = await db[collection_name].index_information()
+        existing.pop("_id_", None)
+
+        missing = []
+        mismatched = []
+        for index in indexes:
+            name = index.document["name"]
+            declared = _declared_spec(index)
+            if name not in existing:
+                missing.append({"name": name, **declared})
+                continue
+            actual = _existing_spec(existing.pop(name))
+            if actual != declared:
+                mismatched.append({"name": name, "declared": declared, "actual": actual})
+
+        extra = [{"name": name, **_existing_spec(info)} for name, info in existing.items()]
+
+        drift[collection_name] = {
+            "missing": missing,
+            "mismatched": mismatched,
+            "extra": extra,
+            "in_sync": not (missing or mismatched or extra)
+        }
+    return drift
@@ -1,19 +1,44 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 from contextlib import asynccontextmanager
 from database import connect_to_mongo, close_mongo_connection
+from indexes import ensure_indexes, backfill_sort_keys
+from search import search_index
+from auth import password_hasher
+from cart_store import cart_store
+from config import settings
+from scheduler import scheduler
+from maintenance import register_jobs
+from uploads import UPLOAD_DIR, FORM_OVERHEAD_BYTES, UploadLimitMiddleware
+from static_files import UploadStaticFiles, upload_hot_cache
+import image_variants
 from routers import auth, products, cart, orders, reviews, favorites, users, system
+from models import DEFAULT_IMAGE, PLACEHOLDER_IMAGE_URL
+import base64
 import os
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     await connect_to_mongo()
+    await ensure_indexes()
+    await backfill_sort_keys()
+    await search_index.rebuild()
+    search_index.start(settings.SEARCH_INDEX_REFRESH_SECONDS)
+    cart_store.start()
+    if settings.SCHEDULER_ENABLED:
+        scheduler.start()
     yield
     # Shutdown
+    await scheduler.stop()
+    await search_index.stop()
+    await cart_store.stop()
+    password_hasher.shutdown()
+    image_variants.shutdown()
     await close_mongo_connection()
 
+register_jobs(scheduler)
+
 app = FastAPI(
     title="CozShop API",
     description="A modern e-commerce API built with FastAPI and MongoDB",
@@ -21,13 +46,17 @@ app = FastAPI(
     lifespan=lifespan
 )
 
-# 确保上传目录存在
-UPLOAD_DIR = "uploads"
-if not os.path.exists(UPLOAD_DIR):
-    os.makedirs(UPLOAD_DIR)
+# 列表接口引用的共享占位图，由内嵌的默认图片生成
+placeholder_path = os.path.join(UPLOAD_DIR, os.path.basename(PLACEHOLDER_IMAGE_URL))
+if not os.path.exists(placeholder_path):
+    with open(placeholder_path, "wb") as f:
+        f.write(base64.b64decode(DEFAULT_IMAGE.split(",", 1)[1]))
+
+# 挂载静态文件目录：上传文件名唯一，响应可长期缓存
+app.mount("/uploads", UploadStaticFiles(directory=UPLOAD_DIR, hot_cache=upload_hot_cache), name="uploads")
 
-# 挂载静态文件目录
-app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR), name="uploads")
+# 上传请求体在接收时就限制大小，超限的不必整个落盘；加在 CORS 之前，413 也带 CORS 头
+app.add_middleware(UploadLimitMiddleware, max_bytes=settings.UPLOAD_MAX_REQUEST_BYTES + FORM_OVERHEAD_BYTES)
 
 # CORS middleware
 app.add_middleware(
@@ -36,6 +65,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Total-Count", "X-Total-Count-Exact"],
 )
 
 # Include routers
@@ -0,0 +1,89 @@
+import asyncio
+from datetime import datetime, timedelta
+from database import get_database
+from config import settings
+from checkout import merge_quantities, release_stock
+from cache import catalog_cache
+from search import search_index
+from auth import evict_user
+from uploads import release_uploads, upload_refs
+
+# 超过这个时间仍未付款的订单视为未完成
+STALE_ORDER_HOURS = 24
+
+INVALID_USER_FILTER = {"$or": [{"email": {"$exists": False}}, {"name": {"$exists": False}}]}
+INVALID_PRODUCT_FILTER = {"$or": [{"name": {"$exists": False}}, {"price": {"$exists": False}}]}
+
+async def _cleanup_stale_orders(ctx, batch_size: int) -> int:
+    db = get_database()
+    cutoff = datetime.utcnow() - timedelta(hours=STALE_ORDER_HOURS)
+    query = {"status": "pending", "created_at": {"$lt": cutoff}}
+    deleted = 0
+    while True:
+        batch = await db.orders.find(query, {"_id": 1}).sort("created_at", 1).limit(batch_size).to_list(length=batch_size)
+        if not batch:
+            return deleted
+        # 逐单条件删除：期间已付款的订单不再匹配；删掉了哪些就归还哪些订单占用的库存
+        removed = await asyncio.gather(*(
+            db.orders.find_one_and_delete({"_id": order["_id"], **query}, projection={"items": 1})
+            for order in batch
+        ))
+        items = [item for order in removed if order for item in order.get("items", [])]
+        quantities = merge_quantities(items)
+        await release_stock(quantities)
+        for product_id in quantities:
+            catalog_cache.invalidate_product(product_id)
+        deleted += sum(1 for order in removed if order)
+        await ctx.checkpoint(incomplete_orders=deleted)
+
+async def _cleanup_invalid_users(ctx, batch_size: int) -> int:
+    db = get_database()
+    deleted = 0
+    while True:
+        batch = await db.users.find(INVALID_USER_FILTER, {"_id": 1}).limit(batch_size).to_list(length=batch_size)
+        if not batch:
+            return deleted
+        ids = [user["_id"] for user in batch]
+        result = await db.users.delete_many({"_id": {"$in": ids}, **INVALID_USER_FILTER})
+        for user_id in ids:
+            evict_user(str(user_id))
+        deleted += result.deleted_count
+        await ctx.checkpoint(invalid_users=deleted)
+
+async def _cleanup_invalid_products(ctx, batch_size: int) -> int:
+    db = get_database()
+    deleted = 0
+    while True:
+        batch = await db.products.find(
+            INVALID_PRODUCT_FILTER, {"status": 1, "category": 1, "price": 1, "image": 1, "images": 1}
+        ).limit(batch_size).to_list(length=batch_size)
+        if not batch:
+            return deleted
+        ids = [product["_id"] for product in batch]
+        result = await db.products.delete_many({"_id": {"$in": ids}, **INVALID_PRODUCT_FILTER})
+        refs = []
+        for product in batch:
+            product_id = str(product["_id"])
+            search_index.remove(product_id)
+            catalog_cache.invalidate_product(product_id, product)
+            refs.extend(upload_refs(product))
+        await release_uploads(refs)
+        deleted += result.deleted_count
+        await ctx.checkpoint(invalid_products=deleted)
+
+async def cleanup_invalid_data(ctx):
+    """Remove stale unpaid orders (returning their stock), invalid users and invalid products.
+
+    Works in batches of CLEANUP_BATCH_SIZE and checkpoints after each one, so
+    progress is visible and the primary gets a pause between batches.
+    """
+    batch_size = settings.CLEANUP_BATCH_SIZE
+    ctx.progress.update({"incomplete_orders": 0, "invalid_users": 0, "invalid_products": 0})
+    await _cleanup_stale_orders(ctx, batch_size)
+    await _cleanup_invalid_users(ctx, batch_size)
+    await _cleanup_invalid_products(ctx, batch_size)
+
+CLEANUP_JOB = "cleanup_invalid_data"
+
+def register_jobs(scheduler):
+    scheduler.register(CLEANUP_JOB, cleanup_invalid_data, settings.CLEANUP_INTERVAL_SECONDS)
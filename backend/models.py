@@ -1,10 +1,19 @@
 from pydantic import BaseModel, EmailStr, Field
-from typing import Optional, List
+from typing import Optional, List, Literal, Union, Dict
 from datetime import datetime
 
 # 定义默认的占位图片（base64 编码的 SVG）
 DEFAULT_IMAGE = "data:image/svg+xml;base64,PHN2ZyB3aWR0aD0iMzAwIiBoZWlnaHQ9IjMwMCIgdmlld0JveD0iMCAwIDMwMCAzMDAiIGZpbGw9Im5vbmUiIHhtbG5zPSJodHRwOi8vd3d3LnczLm9yZy8yMDAwL3N2ZyI+CjxyZWN0IHdpZHRoPSIzMDAiIGhlaWdodD0iMzAwIiBmaWxsPSIjZjBmMGMwIi8+CjxwYXRoIGQ9Ik0xNTAgMTUwIEMxNzcuNjEgMTUwIDE5NSAxMzIuNjEgMTk1IDEwNSBDMTk1IDc3LjM5IDE3Ny42MSA2MCAxNTAgNjAgQzEyMi4zOSA2MCAxMDUgNzcuMzkgMTA1IDEwNSBDMTA1IDEzMi42MSAxMjIuMzkgMTUwIDE1MCAxNTAiIGZpbGw9IiNmZmYiIGZpbGwtb3BhY2l0eT0iMC4yIi8+Cjx0ZXh0IHg9IjE1MCIgeT0iMTY1IiBmb250LWZhbWlseT0iQXJpYWwiIGZvbnQtc2l6ZT0iMTQiIGZpbGw9IiMwMDAiPk5vIEltYWdlPC90ZXh0Pgo8L3N2Zz4="
 
+# 列表接口使用的共享占位图地址，避免每条记录都内嵌 base64 图片
+PLACEHOLDER_IMAGE_URL = "/uploads/placeholder.svg"
+
+def list_image(image: Optional[str]) -> str:
+    """Image to show in list views: the shared placeholder URL instead of the inline default"""
+    if not image or image == DEFAULT_IMAGE:
+        return PLACEHOLDER_IMAGE_URL
+    return image
+
 # User Models
 class UserBase(BaseModel):
     name: str
@@ -61,6 +70,9 @@ class ProductResponse(ProductBase):
     id: str
     rating: float = 0
     numReviews: int = 0
+    ratingDist: Dict[str, int] = Field(default_factory=dict)
+    # [{"source": 原图地址, "variants": [{"width", "format", "url"}]}]
+    image_variants: List[dict] = Field(default_factory=list)
     created_at: datetime
     status: Optional[str] = "pending"
     seller_id: Optional[str] = None
@@ -69,13 +81,45 @@ class ProductResponse(ProductBase):
     class Config:
         from_attributes = True
 
+class ProductCard(BaseModel):
+    """Compact product representation for list views (short summary, no gallery)"""
+    id: str
+    name: str
+    summary: str = ""
+    price: float
+    category: str
+    stock: int
+    image: str = PLACEHOLDER_IMAGE_URL
+    rating: float = 0
+    numReviews: int = 0
+    status: Optional[str] = "pending"
+    is_pinned: bool = False
+
+class ProductBulkDelete(BaseModel):
+    product_ids: List[str] = Field(..., min_length=1, max_length=1000)
+
+class ProductModerationFilter(BaseModel):
+    status: Optional[Literal["pending", "approved", "rejected", "inactive"]] = None
+    seller_id: Optional[str] = None
+    category: Optional[str] = None
+    created_from: Optional[datetime] = None
+    created_to: Optional[datetime] = None
+
+class ProductBulkModerate(BaseModel):
+    # 二选一：指定商品 ID，或按条件筛选（每次最多处理 limit 个）
+    product_ids: Optional[List[str]] = Field(None, min_length=1, max_length=5000)
+    filter: Optional[ProductModerationFilter] = None
+    limit: int = Field(1000, ge=1, le=5000)
+    status: Optional[Literal["pending", "approved", "rejected", "inactive"]] = None
+    is_pinned: Optional[bool] = None
+
 # Cart Models
 class CartItem(BaseModel):
     product_id: str
     name: str
     price: float
     quantity: int = Field(..., gt=0)
-    image: Optional[str] = DEFAULT_IMAGE
+    image: Optional[str] = PLACEHOLDER_IMAGE_URL
 
 class CartResponse(BaseModel):
     user_id: str
@@ -97,7 +141,7 @@ class ShippingAddress(BaseModel):
 class OrderItem(BaseModel):
     name: str
     quantity: int
-    image: Optional[str] = DEFAULT_IMAGE
+    image: Optional[str] = PLACEHOLDER_IMAGE_URL
     price: float
     product_id: str
 
@@ -119,11 +163,18 @@ class OrderResponse(BaseModel):
     status: str = "pending"
     paidAt: Optional[datetime] = None
     deliveredAt: Optional[datetime] = None
+    statusHistory: List[dict] = Field(default_factory=list)
     created_at: datetime
 
     class Config:
         from_attributes = True
 
+class OrderBulkStatus(BaseModel):
+    order_ids: List[str] = Field(..., min_length=1, max_length=1000)
+    status: Literal["processing", "shipped", "delivered", "cancelled"]
+    # 同一个 event_id 重试不会重复流转
+    event_id: Optional[str] = Field(None, min_length=1, max_length=64)
+
 # Review Models
 class ReviewBase(BaseModel):
     rating: int = Field(..., ge=1, le=5)
@@ -136,11 +187,19 @@ class ReviewResponse(ReviewBase):
     id: str
     user_id: str
     product_id: str
+    helpful_count: int = 0
     created_at: datetime
 
     class Config:
         from_attributes = True
 
+class ReviewSummary(BaseModel):
+    product_id: str
+    count: int
+    average: float
+    distribution: Dict[str, int]
+    latest: List[ReviewResponse]
+
 # Favorite Models
 class FavoriteBase(BaseModel):
     product_id: str
@@ -148,11 +207,14 @@ class FavoriteBase(BaseModel):
 class FavoriteCreate(FavoriteBase):
     pass
 
+class FavoriteCheck(BaseModel):
+    product_ids: List[str] = Field(..., min_length=1, max_length=1000)
+
 class FavoriteResponse(BaseModel):
     id: str
     user_id: str
     product_id: str
-    product: ProductResponse
+    product: Union[ProductResponse, ProductCard]
     created_at: datetime
 
     class Config:
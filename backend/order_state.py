@@ -0,0 +1,160 @@
+import uuid
+from datetime import datetime
+from bson import ObjectId
+from pymongo import ReturnDocument
+from database import get_database
+from checkout import merge_quantities, release_stock
+from cache import catalog_cache
+
+# 订单状态流转：目标状态 -> 唯一允许的来源状态
+# pending(待付款) -> processing(待发货) -> shipped(待收货) -> delivered(已完成)；pending 可取消
+TRANSITIONS = {
+    "processing": "pending",
+    "cancelled": "pending",
+    "shipped": "processing",
+    "delivered": "shipped",
+}
+
+# 进入某状态时顺带记录的时间字段
+TIMESTAMP_FIELDS = {
+    "processing": "paidAt",
+    "delivered": "deliveredAt",
+}
+
+def next_statuses(current_status: str) -> list:
+    return [target for target, source in TRANSITIONS.items() if source == current_status]
+
+class TransitionError(Exception):
+    """A transition did not apply: reason is "not_found", "forbidden" or "invalid"."""
+
+    def __init__(self, reason: str, current_status: str = None):
+        super().__init__(reason)
+        self.reason = reason
+        self.current_status = current_status
+
+def status_event(from_status, to_status: str, actor_id: str, at: datetime, event_id: str = None, attempt_id: str = None) -> dict:
+    event = {
+        "event_id": event_id or uuid.uuid4().hex,
+        "from": from_status,
+        "to": to_status,
+        "by": actor_id,
+        "at": at
+    }
+    if attempt_id:
+        event["attempt_id"] = attempt_id
+    return event
+
+def _transition_update(to_status: str, actor_id: str, event_id: str = None, attempt_id: str = None) -> dict:
+    now = datetime.utcnow()
+    fields = {"status": to_status}
+    if to_status in TIMESTAMP_FIELDS:
+        fields[TIMESTAMP_FIELDS[to_status]] = now
+    return {
+        "$set": fields,
+        "$push": {"status_history": status_event(TRANSITIONS[to_status], to_status, actor_id, now, event_id, attempt_id)}
+    }
+
+async def _after_transition(orders: list, to_status: str):
+    # 取消的订单归还预占的库存
+    if to_status != "cancelled" or not orders:
+        return
+    quantities = merge_quantities([item for order in orders for item in order.get("items", [])])
+    await release_stock(quantities)
+    for product_id in quantities:
+        catalog_cache.invalidate_product(product_id)
+
+async def transition(order_id: str, to_status: str, actor_id: str, owner_id: str = None) -> dict:
+    """Move one order to `to_status` with a single conditional update.
+
+    The filter carries the expected current status (and the owner, for
+    customer actions), so a concurrent change simply makes this one miss; the
+    order is only read again to explain a miss. Returns the updated order.
+    """
+    if not ObjectId.is_valid(order_id):
+        raise TransitionError("not_found")
+
+    db = get_database()
+    order = None
+    if to_status in TRANSITIONS:
+        query = {"_id": ObjectId(order_id), "status": TRANSITIONS[to_status]}
+        if owner_id is not None:
+            query["user_id"] = owner_id
+        order = await db.orders.find_one_and_update(
+            query,
+            _transition_update(to_status, actor_id),
+            return_document=ReturnDocument.AFTER
+        )
+
+    if not order:
+        current = await db.orders.find_one({"_id": ObjectId(order_id)}, {"status": 1, "user_id": 1})
+        if not current:
+            raise TransitionError("not_found")
+        if owner_id is not None and current["user_id"] != owner_id:
+            raise TransitionError("forbidden", current["status"])
+        raise TransitionError("invalid", current["status"])
+
+    await _after_transition([order], to_status)
+    return order
+
+async def transition_many(order_ids: list, to_status: str, actor_id: str, event_id: str = None) -> dict:
+    """Move many orders to `to_status` in one update_many.
+
+    Every order that moves gets the same event_id in its history, plus an
+    attempt_id unique to this call. Retrying with the same event_id is safe,
+    even while the first attempt is still running: the update skips orders
+    already carrying the event_id, and only orders holding this call's
+    attempt_id count as updated here (and get their stock released); the rest
+    are reported as already applied.
+    """
+    event_id = event_id or uuid.uuid4().hex
+    attempt_id = uuid.uuid4().hex
+    db = get_database()
+
+    object_ids = []
+    invalid_ids = []
+    for order_id in dict.fromkeys(order_ids):
+        if ObjectId.is_valid(order_id):
+            object_ids.append(ObjectId(order_id))
+        else:
+            invalid_ids.append(order_id)
+
+    if object_ids:
+        await db.orders.update_many(
+            {
+                "_id": {"$in": object_ids},
+                "status": TRANSITIONS[to_status],
+                "status_history.event_id": {"$ne": event_id}
+            },
+            _transition_update(to_status, actor_id, event_id, attempt_id)
+        )
+
+    orders = await db.orders.find(
+        {"_id": {"$in": object_ids}},
+        {"status": 1, "items": 1, "status_history.event_id": 1, "status_history.attempt_id": 1}
+    ).to_list(length=len(object_ids))
+    found = {order["_id"]: order for order in orders}
+
+    updated = []
+    already_applied = []
+    failed = []
+    for object_id in object_ids:
+        order = found.get(object_id)
+        if order is None:
+            failed.append({"id": str(object_id), "reason": "not_found"})
+            continue
+        event = next((event for event in order.get("status_history", []) if event.get("event_id") == event_id), None)
+        if event is None:
+            failed.append({"id": str(object_id), "reason": "invalid", "status": order.get("status")})
+        elif event.get("attempt_id") == attempt_id:
+            updated.append(order)
+        else:
+            already_applied.append(str(object_id))
+
+    await _after_transition(updated, to_status)
+    return {
+        "event_id": event_id,
+        "status": to_status,
+        "updated": [str(order["_id"]) for order in updated],
+        "already_applied": already_applied,
+        "failed": failed + [{"id": order_id, "reason": "not_found"} for order_id in invalid_ids]
+    }
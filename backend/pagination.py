@@ -0,0 +1,76 @@
+import base64
+from bson import json_util
+from fastapi import HTTPException, Response, status
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+TOTAL_COUNT_HEADER = "X-Total-Count"
+TOTAL_COUNT_EXACT_HEADER = "X-Total-Count-Exact"
+
+def encode_cursor(values: list) -> str:
+    """Pack sort-key values into an opaque, URL-safe token"""
+    # json_util 保留 datetime / ObjectId 类型，解码后可直接用于查询
+    return base64.urlsafe_b64encode(json_util.dumps(values).encode()).decode()
+
+def decode_cursor(cursor: str, size: int) -> list:
+    try:
+        values = json_util.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        values = None
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+    return values
+
+def keyset_filter(sort: list, values: list) -> dict:
+    """Match documents that come strictly after `values` in `sort` order"""
+    clauses = []
+    for index, (field, direction) in enumerate(sort):
+        clause = {prefix_field: value for (prefix_field, _), value in zip(sort[:index], values[:index])}
+        clause[field] = {"$lt" if direction < 0 else "$gt": values[index]}
+        clauses.append(clause)
+    return {"$or": clauses}
+
+async def fetch_page(collection, query: dict, sort: list, limit: int, cursor: str = None, projection: dict = None):
+    """Fetch one keyset page.
+
+    `sort` must end with a unique field (normally `_id`) so every document has a
+    distinct position. Returns the documents and the cursor for the next page,
+    or None on the last page.
+    """
+    if cursor:
+        values = decode_cursor(cursor, len(sort))
+        query = {"$and": [query, keyset_filter(sort, values)]}
+
+    # 多取一条用来判断是否还有下一页
+    documents = await collection.find(query, projection).sort(sort).limit(limit + 1).to_list(length=limit + 1)
+
+    next_cursor = None
+    if len(documents) > limit:
+        documents = documents[:limit]
+        last = documents[-1]
+        next_cursor = encode_cursor([last.get(field) for field, _ in sort])
+    return documents, next_cursor
+
+def set_next_cursor(response: Response, next_cursor: str):
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+
+async def estimate_total(collection, query: dict, cap: int) -> tuple:
+    """Count matching documents without scanning all of them.
+
+    Unfiltered counts come from collection metadata; filtered counts stop at
+    `cap`. Returns (total, exact), where exact is False for either shortcut.
+    """
+    if not query:
+        return await collection.estimated_document_count(), False
+    # 多数一条用来判断是否超过上限
+    total = await collection.count_documents(query, limit=cap + 1)
+    if total > cap:
+        return cap, False
+    return total, True
+
+def set_total_count(response: Response, total: int, exact: bool):
+    response.headers[TOTAL_COUNT_HEADER] = str(total)
+    response.headers[TOTAL_COUNT_EXACT_HEADER] = "true" if exact else "false"
@@ -0,0 +1,94 @@
+from bson import ObjectId
+from database import client, get_database
+from checkout import supports_transactions
+
+STARS = range(1, 6)
+
+def empty_rating_stats() -> dict:
+    return {"rating": 0, "numReviews": 0, "ratingSum": 0, "ratingDist": {str(star): 0 for star in STARS}}
+
+def rating_distribution(product: dict) -> dict:
+    """Star histogram of a product as {"1": n, ..., "5": n}"""
+    stored = product.get("ratingDist") or {}
+    return {str(star): stored.get(str(star), 0) for star in STARS}
+
+def _increment_update(rating: int, delta: int) -> list:
+    # 更新管道：计数与平均分在同一次写入里原子更新
+    return [
+        {"$set": {
+            "ratingSum": {"$add": ["$ratingSum", rating * delta]},
+            "numReviews": {"$add": ["$numReviews", delta]},
+            f"ratingDist.{rating}": {"$add": [{"$ifNull": [f"$ratingDist.{rating}", 0]}, delta]}
+        }},
+        {"$set": {"rating": {"$cond": [
+            {"$gt": ["$numReviews", 0]},
+            {"$round": [{"$divide": ["$ratingSum", "$numReviews"]}, 1]},
+            0
+        ]}}}
+    ]
+
+async def _rebuild_stats(product_id: str, session=None):
+    """Recompute a product's rating stats from its reviews"""
+    db = get_database()
+    counts = await db.reviews.aggregate(
+        [
+            {"$match": {"product_id": product_id}},
+            {"$group": {"_id": "$rating", "count": {"$sum": 1}}}
+        ],
+        session=session
+    ).to_list(length=None)
+
+    stats = empty_rating_stats()
+    for entry in counts:
+        if entry["_id"] in STARS:
+            stats["ratingDist"][str(entry["_id"])] = entry["count"]
+            stats["ratingSum"] += entry["_id"] * entry["count"]
+            stats["numReviews"] += entry["count"]
+    if stats["numReviews"]:
+        stats["rating"] = round(stats["ratingSum"] / stats["numReviews"], 1)
+
+    await db.products.update_one({"_id": ObjectId(product_id)}, {"$set": stats}, session=session)
+
+async def _apply_rating(product_id: str, rating: int, delta: int, session=None):
+    db = get_database()
+    result = await db.products.update_one(
+        # 只对已有统计字段的商品做增量，旧数据先从评论重建一次
+        {"_id": ObjectId(product_id), "ratingSum": {"$exists": True}},
+        _increment_update(rating, delta),
+        session=session
+    )
+    if result.matched_count == 0:
+        await _rebuild_stats(product_id, session)
+
+async def _run(callback):
+    # 支持事务时评论与商品统计一起提交，否则依次写入
+    if await supports_transactions():
+        async with await client.start_session() as session:
+            return await session.with_transaction(callback)
+    return await callback(None)
+
+async def add_review(review: dict) -> dict:
+    """Insert a review and fold its rating into the product's stats"""
+    db = get_database()
+
+    async def callback(session):
+        await db.reviews.insert_one(review, session=session)
+        await _apply_rating(review["product_id"], review["rating"], 1, session)
+        return review
+
+    return await _run(callback)
+
+async def remove_review(query: dict):
+    """Delete the review matching `query` and take its rating out of the product's stats.
+
+    Returns the deleted review, or None if nothing matched.
+    """
+    db = get_database()
+
+    async def callback(session):
+        review = await db.reviews.find_one_and_delete(query, session=session)
+        if review and ObjectId.is_valid(review["product_id"]):
+            await _apply_rating(review["product_id"], review["rating"], -1, session)
+        return review
+
+    return await _run(callback)
@@ -2,8 +2,8 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from datetime import datetime
 from models import UserCreate, UserResponse, Token, UserLogin
 from database import get_database
-from auth import get_current_user
-from bson import ObjectId
+from auth import get_current_user_doc, password_hasher
+from pymongo.errors import DuplicateKeyError
 
 router = APIRouter(prefix="/api/auth", tags=["Authentication"])
 
@@ -21,13 +21,19 @@ async def register(user: UserCreate):
     
     # Create new user with password hashing
     user_dict = user.model_dump()
-    from auth import get_password_hash
-    user_dict["password"] = get_password_hash(user_dict["password"])
+    user_dict["password"] = await password_hasher.hash(user_dict["password"])
     user_dict["role"] = "user"
     user_dict["status"] = "active"
     user_dict["created_at"] = datetime.utcnow()
     
-    result = await db.users.insert_one(user_dict)
+    try:
+        result = await db.users.insert_one(user_dict)
+    except DuplicateKeyError:
+        # 并发注册同一邮箱时，由唯一索引拦下后到的那个
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Email already registered"
+        )
     created_user = await db.users.find_one({"_id": result.inserted_id})
     
     # Simplified: use user_id as token
@@ -70,8 +76,7 @@ async def login(user: UserLogin):
         )
     
     # Verify password
-    from auth import verify_password
-    if not verify_password(user.password, user_data.get("password", "")):
+    if not await password_hasher.verify(user.password, user_data.get("password", "")):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
@@ -97,14 +102,7 @@ async def login(user: UserLogin):
     )
 
 @router.get("/profile", response_model=UserResponse)
-async def get_profile(user_id: str = Depends(get_current_user)):
-    db = get_database()
-    user = await db.users.find_one({"_id": ObjectId(user_id)})
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found"
-        )
+async def get_profile(user: dict = Depends(get_current_user_doc)):
     return UserResponse(
         id=str(user["_id"]),
         name=user["name"],
@@ -1,36 +1,60 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from typing import List
-from models import FavoriteCreate, FavoriteResponse, ProductResponse
+from typing import List, Optional
+from models import FavoriteCreate, FavoriteResponse, FavoriteCheck
 from database import get_database
 from auth import get_current_user
+from cache import TTLCache
+from config import settings
+from routers.products import product_to_response, product_to_card, hydrate_products, CARD_PROJECTION
 from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
 from datetime import datetime
 
 router = APIRouter(prefix="/api/favorites", tags=["Favorites"])
 
+# 每个用户收藏的商品 id 集合，收藏/取消收藏时同步更新
+favorite_id_cache = TTLCache(settings.FAVORITE_CACHE_MAX_ENTRIES, settings.FAVORITE_CACHE_TTL_SECONDS)
+# 收藏数超过此值的用户不缓存，直接按需查询
+FAVORITE_CACHE_MAX_IDS = 5000
+
+async def cached_favorite_ids(user_id: str) -> Optional[set]:
+    """The user's favorite product ids, loaded once and then served from memory.
+
+    Returns None when the cache is disabled or the user has too many
+    favorites to keep in memory.
+    """
+    if not settings.FAVORITE_CACHE_ENABLED:
+        return None
+    product_ids = favorite_id_cache.get(user_id)
+    if product_ids is None:
+        db = get_database()
+        favorites = await db.favorites.find(
+            {"user_id": user_id}, {"_id": 0, "product_id": 1}
+        ).to_list(length=FAVORITE_CACHE_MAX_IDS + 1)
+        if len(favorites) > FAVORITE_CACHE_MAX_IDS:
+            return None
+        product_ids = {favorite["product_id"] for favorite in favorites}
+        favorite_id_cache.set(user_id, product_ids)
+    return product_ids
+
 @router.get("", response_model=List[FavoriteResponse])
-async def get_favorites(user_id: str = Depends(get_current_user)):
+async def get_favorites(compact: bool = False, user_id: str = Depends(get_current_user)):
     db = get_database()
     
     favorites = await db.favorites.find({"user_id": user_id}).to_list(length=100)
     
+    # 一次查询取回所有收藏的商品；已删除或未上架的商品直接跳过
+    products = await hydrate_products(
+        [favorite["product_id"] for favorite in favorites],
+        approved_only=True,
+        projection=CARD_PROJECTION if compact else None
+    )
+    
     favorite_responses = []
     for favorite in favorites:
-        # Get product details
-        product = await db.products.find_one({"_id": ObjectId(favorite["product_id"])})
+        product = products.get(favorite["product_id"])
         if product:
-            product_response = ProductResponse(
-                id=str(product["_id"]),
-                name=product["name"],
-                description=product["description"],
-                price=product["price"],
-                category=product["category"],
-                stock=max(product["stock"], 0),
-                image=product.get("image", "data:image/svg+xml;base64,PHN2ZyB3aWR0aD0iMzAwIiBoZWlnaHQ9IjMwMCIgdmlld0JveD0iMCAwIDMwMCAzMDAiIGZpbGw9Im5vbmUiIHhtbG5zPSJodHRwOi8vd3d3LnczLm9yZy8yMDAwL3N2ZyI+CjxyZWN0IHdpZHRoPSIzMDAiIGhlaWdodD0iMzAwIiBmaWxsPSIjZjBmMGMwIi8+CjxwYXRoIGQ9Ik0xNTAgMTUwIEMxNzcuNjEgMTUwIDE5NSAxMzIuNjEgMTk1IDEwNSBDMTk1IDc3LjM5IDE3Ny42MSA2MCAxNTAgNjAgQzEyMi4zOSA2MCAxMDUgNzcuMzkgMTA1IDEwNSBDMTA1IDEzMi42MSAxMjIuMzkgMTUwIDE1MCAxNTAiIGZpbGw9IiNmZmYiIGZpbGwtb3BhY2l0eT0iMC4yIi8+Cjx0ZXh0IHg9IjE1MCIgeT0iMTY1IiBmb250LWZhbWlseT0iQXJpYWwiIGZvbnQtc2l6ZT0iMTQiIGZpbGw9IiMwMDAiPk5vIEltYWdlPC90ZXh0Pgo8L3N2Zz4="),
-                rating=product.get("rating", 0),
-                numReviews=product.get("numReviews", 0),
-                created_at=product["created_at"]
-            )
+            product_response = product_to_card(product) if compact else product_to_response(product)
             
             favorite_responses.append(FavoriteResponse(
                 id=str(favorite["_id"]),
@@ -72,22 +96,21 @@ async def add_to_favorites(favorite: FavoriteCreate, user_id: str = Depends(get_
         "created_at": datetime.utcnow()
     }
     
-    result = await db.favorites.insert_one(favorite_dict)
+    try:
+        result = await db.favorites.insert_one(favorite_dict)
+    except DuplicateKeyError:
+        # 并发收藏同一商品时，由唯一索引拦下后到的那个
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Product already in favorites"
+        )
+    cached_ids = favorite_id_cache.get(user_id)
+    if cached_ids is not None:
+        cached_ids.add(favorite.product_id)
     created_favorite = await db.favorites.find_one({"_id": result.inserted_id})
     
     # Create product response
-    product_response = ProductResponse(
-        id=str(product["_id"]),
-        name=product["name"],
-        description=product["description"],
-        price=product["price"],
-        category=product["category"],
-        stock=max(product["stock"], 0),
-        image=product.get("image", "data:image/svg+xml;base64,PHN2ZyB3aWR0aD0iMzAwIiBoZWlnaHQ9IjMwMCIgdmlld0JveD0iMCAwIDMwMCAzMDAiIGZpbGw9Im5vbmUiIHhtbG5zPSJodHRwOi8vd3d3LnczLm9yZy8yMDAwL3N2ZyI+CjxyZWN0IHdpZHRoPSIzMDAiIGhlaWdodD0iMzAwIiBmaWxsPSIjZjBmMGMwIi8+CjxwYXRoIGQ9Ik0xNTAgMTUwIEMxNzcuNjEgMTUwIDE5NSAxMzIuNjEgMTk1IDEwNSBDMTk1IDc3LjM5IDE3Ny42MSA2MCAxNTAgNjAgQzEyMi4zOSA2MCAxMDUgNzcuMzkgMTA1IDEwNSBDMTA1IDEzMi42MSAxMjIuMzkgMTUwIDE1MCAxNTAiIGZpbGw9IiNmZmYiIGZpbGwtb3BhY2l0eT0iMC4yIi8+Cjx0ZXh0IHg9IjE1MCIgeT0iMTY1IiBmb250LWZhbWlseT0iQXJpYWwiIGZvbnQtc2l6ZT0iMTQiIGZpbGw9IiMwMDAiPk5vIEltYWdlPC90ZXh0Pgo8L3N2Zz4="),
-        rating=product.get("rating", 0),
-        numReviews=product.get("numReviews", 0),
-        created_at=product["created_at"]
-    )
+    product_response = product_to_response(product)
     
     return FavoriteResponse(
         id=str(created_favorite["_id"]),
@@ -106,6 +129,10 @@ async def remove_from_favorites(product_id: str, user_id: str = Depends(get_curr
         "product_id": product_id
     })
     
+    cached_ids = favorite_id_cache.get(user_id)
+    if cached_ids is not None:
+        cached_ids.discard(product_id)
+    
     if result.deleted_count == 0:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -114,10 +141,28 @@ async def remove_from_favorites(product_id: str, user_id: str = Depends(get_curr
     
     return {"message": "Product removed from favorites successfully"}
 
+@router.post("/check")
+async def check_favorites(body: FavoriteCheck, user_id: str = Depends(get_current_user)):
+    product_ids = list(dict.fromkeys(body.product_ids))
+    favorite_ids = await cached_favorite_ids(user_id)
+    if favorite_ids is None:
+        # 走 (user_id, product_id) 唯一索引，一次查询得到所有已收藏的 id
+        db = get_database()
+        favorites = await db.favorites.find(
+            {"user_id": user_id, "product_id": {"$in": product_ids}},
+            {"_id": 0, "product_id": 1}
+        ).to_list(length=len(product_ids))
+        favorite_ids = {favorite["product_id"] for favorite in favorites}
+    
+    return {"favorites": {product_id: product_id in favorite_ids for product_id in product_ids}}
+
 @router.get("/check/{product_id}")
 async def check_favorite(product_id: str, user_id: str = Depends(get_current_user)):
-    db = get_database()
+    favorite_ids = await cached_favorite_ids(user_id)
+    if favorite_ids is not None:
+        return {"is_favorite": product_id in favorite_ids}
     
+    db = get_database()
     favorite = await db.favorites.find_one({
         "user_id": user_id,
         "product_id": product_id
@@ -1,73 +1,133 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Body
-from typing import List
-from models import OrderCreate, OrderResponse, OrderItem
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status, Body
+from typing import List, Literal, Optional
+from models import OrderCreate, OrderResponse, OrderItem, OrderBulkStatus, list_image
 from database import get_database
-from auth import get_current_user, get_current_admin
+from auth import get_current_user, get_current_admin, get_current_user_doc
+from checkout import place_order, merge_quantities, InsufficientStockError
+from order_state import TransitionError, next_statuses, status_event, transition, transition_many
+from cache import catalog_cache
+from cart_store import cart_store
+from exports import ORDER_EXPORT_FIELDS, export_throttle, order_rows
+from pagination import estimate_total, fetch_page, set_next_cursor, set_total_count
 from bson import ObjectId
-from datetime import datetime
+from datetime import datetime, timezone
 
 router = APIRouter(prefix="/api/orders", tags=["Orders"])
 
-@router.get("", response_model=List[OrderResponse])
-async def get_orders(user_id: str = Depends(get_current_user)):
+ORDER_SORT = [("created_at", -1), ("_id", -1)]
+OrderStatus = Literal["pending", "processing", "shipped", "delivered", "cancelled"]
+# 筛选后的总数最多数到这里，超过则返回上限并标记为非精确
+ORDER_COUNT_LIMIT = 10000
+
+def order_to_response(order: dict) -> OrderResponse:
+    return OrderResponse(
+        id=str(order["_id"]),
+        orderNumber=order.get("order_number", ""),
+        user_id=str(order["user_id"]),
+        orderItems=[
+            OrderItem(
+                product_id=str(item["product_id"]),
+                name=item["name"],
+                price=item["price"],
+                quantity=item["quantity"],
+                image=list_image(item.get("image")))
+            for item in order.get("items", [])
+        ],
+        totalPrice=order.get("total_price", 0),
+        status=order["status"],
+        shippingAddress=order.get("shipping_address", {}),
+        paymentMethod=order.get("payment_method", ""),
+        paidAt=order.get("paidAt"),
+        deliveredAt=order.get("deliveredAt"),
+        statusHistory=order.get("status_history", []),
+        created_at=order["created_at"]
+    )
+
+def _utc(value: Optional[datetime]) -> Optional[datetime]:
+    # created_at 以无时区的 UTC 存储
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def order_filter(
+    user_id: Optional[str] = None,
+    order_status: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None
+) -> dict:
+    query = {}
+    if user_id:
+        query["user_id"] = user_id
+    if order_status:
+        query["status"] = order_status
+    created_at = {}
+    if created_from is not None:
+        created_at["$gte"] = _utc(created_from)
+    if created_to is not None:
+        created_at["$lt"] = _utc(created_to)
+    if created_at:
+        query["created_at"] = created_at
+    return query
+
+async def list_orders(response: Response, query: dict, limit: int, cursor: Optional[str]) -> List[OrderResponse]:
+    """One page of orders, newest first, with X-Next-Cursor and (first page only) X-Total-Count"""
     db = get_database()
-    orders = await db.orders.find({"user_id": user_id}).to_list(length=100)
-    orders.sort(key=lambda x: x["created_at"], reverse=True)
-    
-    return [
-        OrderResponse(
-            id=str(order["_id"]),
-            orderNumber=order.get("order_number", ""),
-            user_id=str(order["user_id"]),
-            orderItems=[
-                OrderItem(
-                    product_id=str(item["product_id"]),
-                    name=item["name"],
-                    price=item["price"],
-                    quantity=item["quantity"],
-                    image=item.get("image", "data:image/svg+xml;base64,PHN2ZyB3aWR0aD0iMzAwIiBoZWlnaHQ9IjMwMCIgdmlld0JveD0iMCAwIDMwMCAzMDAiIGZpbGw9Im5vbmUiIHhtbG5zPSJodHRwOi8vd3d3LnczLm9yZy8yMDAwL3N2ZyI+CjxyZWN0IHdpZHRoPSIzMDAiIGhlaWdodD0iMzAwIiBmaWxsPSIjZjBmMGMwIi8+CjxwYXRoIGQ9Ik0xNTAgMTUwIEMxNzcuNjEgMTUwIDE5NSAxMzIuNjEgMTk1IDEwNSBDMTk1IDc3LjM5IDE3Ny42MSA2MCAxNTAgNjAgQzEyMi4zOSA2MCAxMDUgNzcuMzkgMTA1IDEwNSBDMTA1IDEzMi42MSAxMjIuMzkgMTUwIDE1MCAxNTAiIGZpbGw9IiNmZmYiIGZpbGwtb3BhY2l0eT0iMC4yIi8+Cjx0ZXh0IHg9IjE1MCIgeT0iMTY1IiBmb250LWZhbWlseT0iQXJpYWwiIGZvbnQtc2l6ZT0iMTQiIGZpbGw9IiMwMDAiPk5vIEltYWdlPC90ZXh0Pgo8L3N2Zz4="))
-                for item in order.get("items", [])
-            ],
-            totalPrice=order.get("total_price", 0),
-            status=order["status"],
-            shippingAddress=order.get("shipping_address", {}),
-            paymentMethod=order.get("payment_method", ""),
-            created_at=order["created_at"]
+    if cursor:
+        orders, next_cursor = await fetch_page(db.orders, query, ORDER_SORT, limit, cursor)
+    else:
+        (orders, next_cursor), (total, exact) = await asyncio.gather(
+            fetch_page(db.orders, query, ORDER_SORT, limit),
+            estimate_total(db.orders, query, ORDER_COUNT_LIMIT)
         )
-        for order in orders
-    ]
+        set_total_count(response, total, exact)
+    set_next_cursor(response, next_cursor)
+    return [order_to_response(order) for order in orders]
+
+@router.get("", response_model=List[OrderResponse])
+async def get_orders(
+    response: Response,
+    order_status: Optional[OrderStatus] = Query(None, alias="status"),
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    limit: int = Query(100, ge=1, le=100),
+    cursor: Optional[str] = None,
+    user_id: str = Depends(get_current_user)
+):
+    query = order_filter(user_id, order_status, created_from, created_to)
+    return await list_orders(response, query, limit, cursor)
 
 @router.get("/all", response_model=List[OrderResponse])
-async def get_all_orders(user_id: str = Depends(get_current_admin)):
+async def get_all_orders(
+    response: Response,
+    order_status: Optional[OrderStatus] = Query(None, alias="status"),
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    customer_id: Optional[str] = Query(None, alias="user_id"),
+    limit: int = Query(100, ge=1, le=100),
+    cursor: Optional[str] = None,
+    user_id: str = Depends(get_current_admin)
+):
+    query = order_filter(customer_id, order_status, created_from, created_to)
+    return await list_orders(response, query, limit, cursor)
+
+@router.get("/export")
+async def export_orders(
+    export_format: Literal["csv", "ndjson"] = Query("csv", alias="format"),
+    order_status: Optional[OrderStatus] = Query(None, alias="status"),
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    customer_id: Optional[str] = Query(None, alias="user_id"),
+    user_id: str = Depends(get_current_admin)
+):
+    """Stream matching orders newest first, one row per line item"""
     db = get_database()
-    orders = await db.orders.find().to_list(length=100)
-    orders.sort(key=lambda x: x["created_at"], reverse=True)
-    
-    return [
-        OrderResponse(
-            id=str(order["_id"]),
-            orderNumber=order.get("order_number", ""),
-            user_id=str(order["user_id"]),
-            orderItems=[
-                OrderItem(
-                    product_id=str(item["product_id"]),
-                    name=item["name"],
-                    price=item["price"],
-                    quantity=item["quantity"],
-                    image=item.get("image", "data:image/svg+xml;base64,PHN2ZyB3aWR0aD0iMzAwIiBoZWlnaHQ9IjMwMCIgdmlld0JveD0iMCAwIDMwMCAzMDAiIGZpbGw9Im5vbmUiIHhtbG5zPSJodHRwOi8vd3d3LnczLm9yZy8yMDAwL3N2ZyI+CjxyZWN0IHdpZHRoPSIzMDAiIGhlaWdodD0iMzAwIiBmaWxsPSIjZjBmMGMwIi8+CjxwYXRoIGQ9Ik0xNTAgMTUwIEMxNzcuNjEgMTUwIDE5NSAxMzIuNjEgMTk1IDEwNSBDMTk1IDc3LjM5IDE3Ny42MSA2MCAxNTAgNjAgQzEyMi4zOSA2MCAxMDUgNzcuMzkgMTA1IDEwNSBDMTA1IDEzMi42MSAxMjIuMzkgMTUwIDE1MCAxNTAiIGZpbGw9IiNmZmYiIGZpbGwtb3BhY2l0eT0iMC4yIi8+Cjx0ZXh0IHg9IjE1MCIgeT0iMTY1IiBmb250LWZhbWlseT0iQXJpYWwiIGZvbnQtc2l6ZT0iMTQiIGZpbGw9IiMwMDAiPk5vIEltYWdlPC90ZXh0Pgo8L3N2Zz4="))
-                for item in order.get("items", [])
-            ],
-            totalPrice=order.get("total_price", 0),
-            status=order["status"],
-            shippingAddress=order.get("shipping_address", {}),
-            paymentMethod=order.get("payment_method", ""),
-            created_at=order["created_at"]
-        )
-        for order in orders
-    ]
+    query = order_filter(customer_id, order_status, created_from, created_to)
+    cursor = db.orders.find(query).sort(ORDER_SORT)
+    return export_throttle.response(cursor, order_rows, ORDER_EXPORT_FIELDS, export_format, "orders")
 
 @router.get("/{order_id}", response_model=OrderResponse)
-async def get_order(order_id: str, user_id: str = Depends(get_current_user)):
+async def get_order(order_id: str, user_id: str = Depends(get_current_user), user: dict = Depends(get_current_user_doc)):
     db = get_database()
     try:
         order = await db.orders.find_one({"_id": ObjectId(order_id)})
@@ -84,39 +144,21 @@ async def get_order(order_id: str, user_id: str = Depends(get_current_user)):
         )
     
     # Check if user owns the order or is admin
-    user = await db.users.find_one({"_id": ObjectId(user_id)})
     if order["user_id"] != user_id and user.get("role") != "admin":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not authorized to access this order"
         )
     
-    return OrderResponse(
-        id=str(order["_id"]),
-        orderNumber=order.get("order_number", ""),
-        user_id=str(order["user_id"]),
-        orderItems=[
-            OrderItem(
-                product_id=str(item["product_id"]),
-                name=item["name"],
-                price=item["price"],
-                quantity=item["quantity"],
-                image=item.get("image", "data:image/svg+xml;base64,PHN2ZyB3aWR0aD0iMzAwIiBoZWlnaHQ9IjMwMCIgdmlld0JveD0iMCAwIDMwMCAzMDAiIGZpbGw9Im5vbmUiIHhtbG5zPSJodHRwOi8vd3d3LnczLm9yZy8yMDAwL3N2ZyI+CjxyZWN0IHdpZHRoPSIzMDAiIGhlaWdodD0iMzAwIiBmaWxsPSIjZjBmMGMwIi8+CjxwYXRoIGQ9Ik0xNTAgMTUwIEMxNzcuNjEgMTUwIDE5NSAxMzIuNjEgMTk1IDEwNSBDMTk1IDc3LjM5IDE3Ny42MSA2MCAxNTAgNjAgQzEyMi4zOSA2MCAxMDUgNzcuMzkgMTA1IDEwNSBDMTA1IDEzMi42MSAxMjIuMzkgMTUwIDE1MCAxNTAiIGZpbGw9IiNmZmYiIGZpbGwtb3BhY2l0eT0iMC4yIi8+Cjx0ZXh0IHg9IjE1MCIgeT0iMTY1IiBmb250LWZhbWlseT0iQXJpYWwiIGZvbnQtc2l6ZT0iMTQiIGZpbGw9IiMwMDAiPk5vIEltYWdlPC90ZXh0Pgo8L3N2Zz4="))
-            for item in order.get("items", [])
-        ],
-        totalPrice=order.get("total_price", 0),
-        status=order["status"],
-        shippingAddress=order.get("shipping_address", {}),
-        paymentMethod=order.get("payment_method", ""),
-        created_at=order["created_at"]
-    )
+    return order_to_response(order)
 
 @router.post("", response_model=OrderResponse, status_code=status.HTTP_201_CREATED)
 async def create_order(order_data: OrderCreate, user_id: str = Depends(get_current_user)):
     db = get_database()
     
-    # Get cart
-    cart = await db.carts.find_one({"user_id": user_id})
+    # 先写回缓冲中的购物车改动，再读取：订单内容与数据库里的购物车一致
+    await cart_store.flush(user_id)
+    cart = await cart_store.get(user_id)
     if not cart or not cart.get("items"):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -131,249 +173,105 @@ async def create_order(order_data: OrderCreate, user_id: str = Depends(get_curre
     order_number = f"{timestamp}{user_id[:8]}"
     
     # Create order
+    created_at = datetime.utcnow()
     order_dict = {
         "user_id": user_id,
         "order_number": order_number,
-        "items": cart["items"],
+        "items": [dict(item) for item in cart["items"]],
         "total_price": total_price,
         "status": "pending",
         "shipping_address": order_data.shippingAddress.model_dump(),
         "payment_method": order_data.paymentMethod,
-        "created_at": datetime.utcnow()
+        "status_history": [status_event(None, "pending", user_id, created_at)],
+        "created_at": created_at
     }
     
-    result = await db.orders.insert_one(order_dict)
-    created_order = await db.orders.find_one({"_id": result.inserted_id})
-    
-    # Clear cart
-    await db.carts.delete_one({"user_id": user_id})
-    
-    # Update product stock
-    for item in cart["items"]:
-        await db.products.update_one(
-            {"_id": ObjectId(item["product_id"])},
-            {"$inc": {"stock": -item["quantity"]}}
-        )
-    
-    return OrderResponse(
-        id=str(created_order["_id"]),
-        orderNumber=created_order.get("order_number", ""),
-        user_id=str(created_order["user_id"]),
-        orderItems=[
-            OrderItem(
-                product_id=str(item["product_id"]),
-                name=item["name"],
-                price=item["price"],
-                quantity=item["quantity"],
-                image=item.get("image", "data:image/svg+xml;base64,PHN2ZyB3aWR0aD0iMzAwIiBoZWlnaHQ9IjMwMCIgdmlld0JveD0iMCAwIDMwMCAzMDAiIGZpbGw9Im5vbmUiIHhtbG5zPSJodHRwOi8vd3d3LnczLm9yZy8yMDAwL3N2ZyI+CjxyZWN0IHdpZHRoPSIzMDAiIGhlaWdodD0iMzAwIiBmaWxsPSIjZjBmMGMwIi8+CjxwYXRoIGQ9Ik0xNTAgMTUwIEMxNzcuNjEgMTUwIDE5NSAxMzIuNjEgMTk1IDEwNSBDMTk1IDc3LjM5IDE3Ny42MSA2MCAxNTAgNjAgQzEyMi4zOSA2MCAxMDUgNzcuMzkgMTA1IDEwNSBDMTA1IDEzMi42MSAxMjIuMzkgMTUwIDE1MCAxNTAiIGZpbGw9IiNmZmYiIGZpbGwtb3BhY2l0eT0iMC4yIi8+Cjx0ZXh0IHg9IjE1MCIgeT0iMTY1IiBmb250LWZhbWlseT0iQXJpYWwiIGZvbnQtc2l6ZT0iMTQiIGZpbGw9IiMwMDAiPk5vIEltYWdlPC90ZXh0Pgo8L3N2Zz4="))
-            for item in created_order.get("items", [])
-        ],
-        totalPrice=created_order.get("total_price", 0),
-        status=created_order["status"],
-        shippingAddress=created_order.get("shipping_address", {}),
-        paymentMethod=created_order.get("payment_method", ""),
-        created_at=created_order["created_at"]
-    )
-
-@router.put("/{order_id}/status")
-async def update_order_status(order_id: str, status_data: dict = Body(...), user_id: str = Depends(get_current_admin)):
-    db = get_database()
     try:
-        order = await db.orders.find_one({"_id": ObjectId(order_id)})
-    except:
+        cart_cleared = await place_order(order_dict)
+    except InsufficientStockError as e:
+        names = {item["product_id"]: item["name"] for item in cart["items"]}
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Order not found"
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Insufficient stock for: {', '.join(names.get(product_id, product_id) for product_id in e.product_ids)}"
         )
     
-    if not order:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Order not found"
-        )
+    # 下单期间购物车又有改动时，只移除已下单的数量，新加入的商品保留
+    await cart_store.remove_ordered(user_id, order_dict["items"], cart_cleared)
+    for product_id in merge_quantities(order_dict["items"]):
+        catalog_cache.invalidate_product(product_id)
     
-    status = status_data.get("status")
-    if not status:
+    return order_to_response(order_dict)
+
+async def apply_transition(order_id: str, to_status: str, actor_id: str, owner_id: Optional[str] = None, invalid_detail: Optional[str] = None) -> dict:
+    """Run a state-machine transition and turn a miss into the matching HTTP error"""
+    try:
+        return await transition(order_id, to_status, actor_id, owner_id)
+    except TransitionError as e:
+        if e.reason == "not_found":
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Order not found"
+            )
+        if e.reason == "forbidden":
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Not authorized to access this order"
+            )
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Status is required"
+            detail=invalid_detail or f"Invalid status transition. From {e.current_status} you can only go to: {', '.join(next_statuses(e.current_status))}"
         )
-    
-    # 严格的状态流转逻辑
-    current_status = order["status"]
-    valid_transitions = {
-        "pending": ["processing", "cancelled"],  # 待付款 -> 待发货或已取消
-        "processing": ["shipped"],  # 待发货 -> 待收货
-        "shipped": ["delivered"],  # 待收货 -> 已完成
-        "delivered": [],  # 已完成 -> 无
-        "cancelled": []  # 已取消 -> 无
-    }
-    
-    if status not in valid_transitions.get(current_status, []):
+
+@router.post("/bulk-status")
+async def bulk_update_order_status(bulk: OrderBulkStatus, user_id: str = Depends(get_current_admin)):
+    """Apply one status transition to many orders, e.g. ship a whole batch"""
+    return await transition_many(bulk.order_ids, bulk.status, user_id, bulk.event_id)
+
+@router.put("/{order_id}/status")
+async def update_order_status(order_id: str, status_data: dict = Body(...), user_id: str = Depends(get_current_admin)):
+    new_status = status_data.get("status")
+    if not new_status:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Invalid status transition. From {current_status} you can only go to: {', '.join(valid_transitions.get(current_status, []))}"
+            detail="Status is required"
         )
     
-    await db.orders.update_one(
-        {"_id": ObjectId(order_id)},
-        {"$set": {"status": status}}
-    )
-    
+    # 流转规则集中在 order_state.TRANSITIONS
+    await apply_transition(order_id, new_status, user_id)
     return {"message": "Order status updated successfully"}
 
 @router.put("/{order_id}/pay")
 async def pay_order(order_id: str, user_id: str = Depends(get_current_user)):
-    db = get_database()
-    try:
-        order = await db.orders.find_one({"_id": ObjectId(order_id)})
-    except:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Order not found"
-        )
-    
-    if not order:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Order not found"
-        )
-    
-    # Check if user owns the order
-    if order["user_id"] != user_id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Not authorized to access this order"
-        )
-    
-    # Check if order is in pending status
-    if order["status"] != "pending":
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Order can only be paid if it's in pending status"
-        )
-    
     # Update status to processing (待发货)
-    await db.orders.update_one(
-        {"_id": ObjectId(order_id)},
-        {"$set": {"status": "processing", "paidAt": datetime.utcnow()}}
+    await apply_transition(
+        order_id, "processing", user_id, owner_id=user_id,
+        invalid_detail="Order can only be paid if it's in pending status"
     )
-    
     return {"message": "Order paid successfully"}
 
 @router.put("/{order_id}/cancel")
 async def cancel_order(order_id: str, user_id: str = Depends(get_current_user)):
-    db = get_database()
-    try:
-        order = await db.orders.find_one({"_id": ObjectId(order_id)})
-    except:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Order not found"
-        )
-    
-    if not order:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Order not found"
-        )
-    
-    # Check if user owns the order
-    if order["user_id"] != user_id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Not authorized to access this order"
-        )
-    
-    # Check if order is in pending status
-    if order["status"] != "pending":
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Order can only be cancelled if it's in pending status"
-        )
-    
-    # Update status to cancelled
-    await db.orders.update_one(
-        {"_id": ObjectId(order_id)},
-        {"$set": {"status": "cancelled"}}
+    # Update status to cancelled; reserved stock is given back
+    await apply_transition(
+        order_id, "cancelled", user_id, owner_id=user_id,
+        invalid_detail="Order can only be cancelled if it's in pending status"
     )
-    
-    # Restore product stock
-    for item in order.get("items", []):
-        await db.products.update_one(
-            {"_id": ObjectId(item["product_id"])},
-            {"$inc": {"stock": item["quantity"]}}
-        )
-    
     return {"message": "Order cancelled successfully"}
 
 @router.put("/{order_id}/deliver")
 async def deliver_order(order_id: str, user_id: str = Depends(get_current_admin)):
-    db = get_database()
-    try:
-        order = await db.orders.find_one({"_id": ObjectId(order_id)})
-    except:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Order not found"
-        )
-    
-    if not order:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Order not found"
-        )
-    
-    # Check if order is in processing status
-    if order["status"] != "processing":
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Order can only be delivered if it's in processing status"
-        )
-    
     # Update status to shipped (待收货)
-    await db.orders.update_one(
-        {"_id": ObjectId(order_id)},
-        {"$set": {"status": "shipped"}}
+    await apply_transition(
+        order_id, "shipped", user_id,
+        invalid_detail="Order can only be delivered if it's in processing status"
     )
-    
     return {"message": "Order delivered successfully"}
 
 @router.put("/{order_id}/complete")
 async def complete_order(order_id: str, user_id: str = Depends(get_current_user)):
-    db = get_database()
-    try:
-        order = await db.orders.find_one({"_id": ObjectId(order_id)})
-    except:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Order not found"
-        )
-    
-    if not order:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Order not found"
-        )
-    
-    # Check if user owns the order
-    if order["user_id"] != user_id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Not authorized to access this order"
-        )
-    
-    # Check if order is in shipped status
-    if order["status"] != "shipped":
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Order can only be completed if it's in shipped status"
-        )
-    
     # Update status to delivered (已完成)
-    await db.orders.update_one(
-        {"_id": ObjectId(order_id)},
-        {"$set": {"status": "delivered", "deliveredAt": datetime.utcnow()}}
+    await apply_transition(
+        order_id, "delivered", user_id, owner_id=user_id,
+        invalid_detail="Order can only be completed if it's in shipped status"
     )
-    
-    return {"message": "Order completed successfully"}
\ No newline at end of file
+    return {"message": "Order completed successfully"}
@@ -1,21 +1,165 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Body, UploadFile, File, Form
-from typing import List, Optional, Union
-from models import ProductCreate, ProductUpdate, ProductResponse
+from fastapi import APIRouter, Depends, HTTPException, status, Body, UploadFile, File, Form, Query, Response, BackgroundTasks
+from typing import List, Literal, Optional, Union
+from models import ProductCreate, ProductUpdate, ProductResponse, ProductCard, ProductBulkDelete, ProductBulkModerate, ProductModerationFilter, DEFAULT_IMAGE, list_image
 from database import get_database
-from auth import get_current_user, get_current_admin
+from auth import get_current_user, get_current_admin, get_current_user_doc
+from search import MAX_RESULTS, search_index
+from exports import PRODUCT_EXPORT_FIELDS, export_throttle, product_rows
+from pagination import decode_cursor, encode_cursor, fetch_page, set_next_cursor
+from cache import catalog_cache, normalize_search
+from ratings import rating_distribution, empty_rating_stats
+from uploads import save_uploads, upload_refs, acquire_uploads, release_uploads
+from collections import Counter
+from image_variants import generate_product_variants, variant_sources
+from pymongo import ASCENDING, ReturnDocument
 from bson import ObjectId
-from datetime import datetime
-import os
-import uuid
+from datetime import datetime, timezone
+import re
 
 router = APIRouter(prefix="/api/products", tags=["Products"])
 
-@router.get("", response_model=List[ProductResponse])
-async def get_products(search: Optional[str] = None, category: Optional[str] = None, min_price: Optional[float] = None, max_price: Optional[float] = None):
+# Listing order: pinned products first, then newest first; _id breaks ties
+LIST_SORT = [("is_pinned", -1), ("created_at", -1), ("_id", -1)]
+
+# Fields a product card needs, plus the sort keys used by pagination cursors
+CARD_PROJECTION = {
+    "name": 1, "description": 1, "price": 1, "category": 1, "stock": 1, "image": 1,
+    "rating": 1, "numReviews": 1, "status": 1, "is_pinned": 1, "created_at": 1,
+    "thumbnail": 1
+}
+# 卡片上的描述只显示两行，截断后再返回
+CARD_SUMMARY_LENGTH = 120
+
+def product_to_response(product: dict) -> ProductResponse:
+    return ProductResponse(
+        id=str(product["_id"]),
+        name=product["name"],
+        description=product["description"],
+        price=product["price"],
+        category=product["category"],
+        stock=max(product["stock"], 0),
+        image=product.get("image", DEFAULT_IMAGE),
+        images=product.get("images", []),
+        image_variants=product.get("image_variants", []),
+        rating=product.get("rating", 0),
+        numReviews=product.get("numReviews", 0),
+        ratingDist=rating_distribution(product),
+        created_at=product["created_at"],
+        status=product.get("status", "pending"),
+        seller_id=product.get("seller_id"),
+        is_pinned=product.get("is_pinned", False)
+    )
+
+def product_to_card(product: dict) -> ProductCard:
+    return ProductCard(
+        id=str(product["_id"]),
+        name=product["name"],
+        summary=(product.get("description") or "")[:CARD_SUMMARY_LENGTH],
+        price=product["price"],
+        category=product["category"],
+        stock=max(product["stock"], 0),
+        # 有缩略图时列表只返回小图
+        image=product.get("thumbnail") or list_image(product.get("image")),
+        rating=product.get("rating", 0),
+        numReviews=product.get("numReviews", 0),
+        status=product.get("status", "pending"),
+        is_pinned=product.get("is_pinned", False)
+    )
+
+def products_to_list(products: list, compact: bool) -> list:
+    if compact:
+        return [product_to_card(product) for product in products]
+    return [product_to_response(product) for product in products]
+
+def apply_search(query: dict, search: str, status: Optional[str] = None):
+    """Restrict query to search hits and return their ids ranked by relevance.
+
+    Falls back to an escaped regex match (and returns None) while the search
+    index is not available, and when there are more than MAX_RESULTS hits:
+    the ranked list would be cut before the category/price filters run and
+    silently drop matching products.
+    """
+    if search_index.ready:
+        ranked_ids = search_index.search(search, status=status, limit=MAX_RESULTS + 1)
+        if len(ranked_ids) <= MAX_RESULTS:
+            query["_id"] = {"$in": [ObjectId(product_id) for product_id in ranked_ids]}
+            return ranked_ids
+    
+    pattern = re.escape(search)
+    query["$and"] = query.get("$and", []) + [
+        {"$or": [
+            {"name": {"$regex": pattern, "$options": "i"}},
+            {"description": {"$regex": pattern, "$options": "i"}}
+        ]}
+    ]
+    return None
+
+def sort_by_rank(products: list, ranked_ids: list) -> list:
+    rank = {product_id: index for index, product_id in enumerate(ranked_ids)}
+    return sorted(products, key=lambda product: rank[str(product["_id"])])
+
+async def hydrate_products(product_ids, approved_only: bool = False, projection: Optional[dict] = None) -> dict:
+    """Resolve product ids to product documents with a single `$in` query.
+
+    Returns a dict keyed by string id. Invalid, missing and (with
+    `approved_only`) unapproved products are simply absent from it.
+    """
+    object_ids = list({ObjectId(product_id) for product_id in product_ids if ObjectId.is_valid(str(product_id))})
+    if not object_ids:
+        return {}
+    query = {"_id": {"$in": object_ids}}
+    if approved_only:
+        query["status"] = "approved"
     db = get_database()
+    products = await db.products.find(query, projection).to_list(length=len(object_ids))
+    return {str(product["_id"]): product for product in products}
+
+async def fetch_product_page(query: dict, ranked_ids: Optional[list], limit: int, cursor: Optional[str], projection: Optional[dict] = None):
+    """Fetch one page of products and the cursor for the next one"""
+    db = get_database()
+    if ranked_ids is None:
+        return await fetch_page(db.products, query, LIST_SORT, limit, cursor, projection)
     
-    print("=== Product API Call Received ===")
-    print(f"Params: search={search}, category={category}, min_price={min_price}, max_price={max_price}")
+    # Search results are ordered by relevance: the cursor is an offset into the
+    # ranked hits that also pass the remaining filters
+    offset = decode_cursor(cursor, 1)[0] if cursor else 0
+    if not isinstance(offset, int) or offset < 0:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+    
+    matches = await db.products.find(query, {"_id": 1}).to_list(length=len(ranked_ids))
+    page_ids = [product["_id"] for product in sort_by_rank(matches, ranked_ids)[offset:offset + limit + 1]]
+    next_cursor = None
+    if len(page_ids) > limit:
+        page_ids = page_ids[:limit]
+        next_cursor = encode_cursor([offset + limit])
+    
+    products = await db.products.find({"_id": {"$in": page_ids}}, projection).to_list(length=limit)
+    return sort_by_rank(products, ranked_ids), next_cursor
+
+@router.get("", response_model=Union[List[ProductResponse], List[ProductCard]])
+async def get_products(
+    response: Response,
+    search: Optional[str] = None,
+    category: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    limit: int = Query(100, ge=1, le=100),
+    cursor: Optional[str] = None,
+    compact: bool = False
+):
+    search = normalize_search(search)
+    cache_key = catalog_cache.list_key(
+        search=search, category=category, min_price=min_price, max_price=max_price,
+        limit=limit, cursor=cursor, compact=compact
+    )
+    cached = catalog_cache.get_list(cache_key)
+    if cached is not None:
+        items, next_cursor = cached
+        set_next_cursor(response, next_cursor)
+        return items
     
     # For public/homepage, always only show approved products
     # This ensures that inactive products are not visible on homepage
@@ -23,13 +167,9 @@ async def get_products(search: Optional[str] = None, category: Optional[str] = N
         "status": "approved"
     }
     
+    ranked_ids = None
     if search:
-        query["$and"] = query.get("$and", []) + [
-            {"$or": [
-                {"name": {"$regex": search, "$options": "i"}},
-                {"description": {"$regex": search, "$options": "i"}}
-            ]}
-        ]
+        ranked_ids = apply_search(query, search, status="approved")
     
     if category:
         query["$and"] = query.get("$and", []) + [
@@ -46,51 +186,21 @@ async def get_products(search: Optional[str] = None, category: Optional[str] = N
             {"price": {"$lte": max_price}}
         ]
     
-    print(f"Query: {query}")
-    
-    # Sort products: pinned products first, then by creation time (newest first)
-    products = await db.products.find(query).sort([("is_pinned", -1), ("created_at", -1)]).to_list(length=100)
-    print(f"Found {len(products)} products")
+    projection = CARD_PROJECTION if compact else None
+    products, next_cursor = await fetch_product_page(query, ranked_ids, limit, cursor, projection)
+    set_next_cursor(response, next_cursor)
     
-    if products:
-        print(f"First 3 products: {[p.get('name') for p in products[:3]]}")
-    
-    return [
-        ProductResponse(
-            id=str(product["_id"]),
-            name=product["name"],
-            description=product["description"],
-            price=product["price"],
-            category=product["category"],
-            stock=max(product["stock"], 0),
-            image=product.get("image", "data:image/svg+xml;base64,PHN2ZyB3aWR0aD0iMzAwIiBoZWlnaHQ9IjMwMCIgdmlld0JveD0iMCAwIDMwMCAzMDAiIGZpbGw9Im5vbmUiIHhtbG5zPSJodHRwOi8vd3d3LnczLm9yZy8yMDAwL3N2ZyI+CjxyZWN0IHdpZHRoPSIzMDAiIGhlaWdodD0iMzAwIiBmaWxsPSIjZjBmMGMwIi8+CjxwYXRoIGQ9Ik0xNTAgMTUwIEMxNzcuNjEgMTUwIDE5NSAxMzIuNjEgMTk1IDEwNSBDMTk1IDc3LjM5IDE3Ny42MSA2MCAxNTAgNjAgQzEyMi4zOSA2MCAxMDUgNzcuMzkgMTA1IDEwNSBDMTA1IDEzMi42MSAxMjIuMzkgMTUwIDE1MCAxNTAiIGZpbGw9IiNmZmYiIGZpbGwtb3BhY2l0eT0iMC4yIi8+Cjx0ZXh0IHg9IjE1MCIgeT0iMTY1IiBmb250LWZhbWlseT0iQXJpYWwiIGZvbnQtc2l6ZT0iMTQiIGZpbGw9IiMwMDAiPk5vIEltYWdlPC90ZXh0Pgo8L3N2Zz4="),
-            rating=product.get("rating", 0),
-            numReviews=product.get("numReviews", 0),
-            created_at=product["created_at"],
-            status=product.get("status", "pending"),
-            seller_id=product.get("seller_id"),
-            is_pinned=product.get("is_pinned", False)
-        )
-        for product in products
-    ]
+    items = products_to_list(products, compact)
+    catalog_cache.set_list(cache_key, (items, next_cursor), [str(product["_id"]) for product in products])
+    return items
 
-@router.get("/all", response_model=List[ProductResponse])
-async def get_all_products(search: Optional[str] = None, category: Optional[str] = None, min_price: Optional[float] = None, max_price: Optional[float] = None, user_id: str = Depends(get_current_admin)):
-    db = get_database()
-    
-    print("=== Get All Products API Call Received ===")
-    print(f"Params: search={search}, category={category}, min_price={min_price}, max_price={max_price}")
-    
-    # For admin, return all products regardless of status
+def admin_product_filter(search: Optional[str], category: Optional[str], min_price: Optional[float], max_price: Optional[float]):
+    """Query for the admin product list (any status) and the ranked search hits, if any"""
     query = {}
     
+    ranked_ids = None
     if search:
-        query["$and"] = query.get("$and", []) + [
-            {"$or": [
-                {"name": {"$regex": search, "$options": "i"}},
-                {"description": {"$regex": search, "$options": "i"}}
-            ]}
-        ]
+        ranked_ids = apply_search(query, search)
     
     if category:
         query["$and"] = query.get("$and", []) + [
@@ -106,60 +216,72 @@ async def get_all_products(search: Optional[str] = None, category: Optional[str]
         query["$and"] = query.get("$and", []) + [
             {"price": {"$lte": max_price}}
         ]
+    return query, ranked_ids
+
+@router.get("/all", response_model=Union[List[ProductResponse], List[ProductCard]])
+async def get_all_products(
+    response: Response,
+    search: Optional[str] = None,
+    category: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    limit: int = Query(100, ge=1, le=100),
+    cursor: Optional[str] = None,
+    compact: bool = False,
+    user_id: str = Depends(get_current_admin)
+):
+    print("=== Get All Products API Call Received ===")
+    print(f"Params: search={search}, category={category}, min_price={min_price}, max_price={max_price}")
     
+    query, ranked_ids = admin_product_filter(search, category, min_price, max_price)
     print(f"Query: {query}")
     
-    # Sort products: pinned products first, then by creation time (newest first)
-    products = await db.products.find(query).sort([("is_pinned", -1), ("created_at", -1)]).to_list(length=100)
+    projection = CARD_PROJECTION if compact else None
+    products, next_cursor = await fetch_product_page(query, ranked_ids, limit, cursor, projection)
+    set_next_cursor(response, next_cursor)
     print(f"Found {len(products)} products")
     
     if products:
         print(f"First 3 products: {[p.get('name') for p in products[:3]]}")
     
-    return [
-        ProductResponse(
-            id=str(product["_id"]),
-            name=product["name"],
-            description=product["description"],
-            price=product["price"],
-            category=product["category"],
-            stock=max(product["stock"], 0),
-            image=product.get("image", "data:image/svg+xml;base64,PHN2ZyB3aWR0aD0iMzAwIiBoZWlnaHQ9IjMwMCIgdmlld0JveD0iMCAwIDMwMCAzMDAiIGZpbGw9Im5vbmUiIHhtbG5zPSJodHRwOi8vd3d3LnczLm9yZy8yMDAwL3N2ZyI+CjxyZWN0IHdpZHRoPSIzMDAiIGhlaWdodD0iMzAwIiBmaWxsPSIjZjBmMGMwIi8+CjxwYXRoIGQ9Ik0xNTAgMTUwIEMxNzcuNjEgMTUwIDE5NSAxMzIuNjEgMTk1IDEwNSBDMTk1IDc3LjM5IDE3Ny42MSA2MCAxNTAgNjAgQzEyMi4zOSA2MCAxMDUgNzcuMzkgMTA1IDEwNSBDMTA1IDEzMi42MSAxMjIuMzkgMTUwIDE1MCAxNTAiIGZpbGw9IiNmZmYiIGZpbGwtb3BhY2l0eT0iMC4yIi8+Cjx0ZXh0IHg9IjE1MCIgeT0iMTY1IiBmb250LWZhbWlseT0iQXJpYWwiIGZvbnQtc2l6ZT0iMTQiIGZpbGw9IiMwMDAiPk5vIEltYWdlPC90ZXh0Pgo8L3N2Zz4="),
-            rating=product.get("rating", 0),
-            numReviews=product.get("numReviews", 0),
-            created_at=product["created_at"],
-            status=product.get("status", "pending"),
-            seller_id=product.get("seller_id"),
-            is_pinned=product.get("is_pinned", False)
-        )
-        for product in products
-    ]
+    return products_to_list(products, compact)
 
-@router.get("/my", response_model=List[ProductResponse])
-async def get_my_products(user_id: str = Depends(get_current_user)):
+@router.get("/my", response_model=Union[List[ProductResponse], List[ProductCard]])
+async def get_my_products(
+    response: Response,
+    limit: int = Query(100, ge=1, le=100),
+    cursor: Optional[str] = None,
+    compact: bool = False,
+    user_id: str = Depends(get_current_user)
+):
     db = get_database()
-    products = await db.products.find({"seller_id": user_id}).to_list(length=100)
-    return [
-        ProductResponse(
-            id=str(product["_id"]),
-            name=product["name"],
-            description=product["description"],
-            price=product["price"],
-            category=product["category"],
-            stock=max(product["stock"], 0),
-            image=product.get("image", "data:image/svg+xml;base64,PHN2ZyB3aWR0aD0iMzAwIiBoZWlnaHQ9IjMwMCIgdmlld0JveD0iMCAwIDMwMCAzMDAiIGZpbGw9Im5vbmUiIHhtbG5zPSJodHRwOi8vd3d3LnczLm9yZy8yMDAwL3N2ZyI+CjxyZWN0IHdpZHRoPSIzMDAiIGhlaWdodD0iMzAwIiBmaWxsPSIjZjBmMGMwIi8+CjxwYXRoIGQ9Ik0xNTAgMTUwIEMxNzcuNjEgMTUwIDE5NSAxMzIuNjEgMTk1IDEwNSBDMTk1IDc3LjM5IDE3Ny42MSA2MCAxNTAgNjAgQzEyMi4zOSA2MCAxMDUgNzcuMzkgMTA1IDEwNSBDMTA1IDEzMi42MSAxMjIuMzkgMTUwIDE1MCAxNTAiIGZpbGw9IiNmZmYiIGZpbGwtb3BhY2l0eT0iMC4yIi8+Cjx0ZXh0IHg9IjE1MCIgeT0iMTY1IiBmb250LWZhbWlseT0iQXJpYWwiIGZvbnQtc2l6ZT0iMTQiIGZpbGw9IiMwMDAiPk5vIEltYWdlPC90ZXh0Pgo8L3N2Zz4="),
-            rating=product.get("rating", 0),
-            numReviews=product.get("numReviews", 0),
-            created_at=product["created_at"],
-            status=product.get("status", "pending"),
-            seller_id=product.get("seller_id"),
-            is_pinned=product.get("is_pinned", False)
-        )
-        for product in products
-    ]
+    projection = CARD_PROJECTION if compact else None
+    products, next_cursor = await fetch_page(db.products, {"seller_id": user_id}, LIST_SORT, limit, cursor, projection)
+    set_next_cursor(response, next_cursor)
+    return products_to_list(products, compact)
+
+@router.get("/export")
+async def export_products(
+    export_format: Literal["csv", "ndjson"] = Query("csv", alias="format"),
+    search: Optional[str] = None,
+    category: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    user_id: str = Depends(get_current_admin)
+):
+    """Stream every product matching the admin list filters, newest first"""
+    db = get_database()
+    # 导出按列表顺序输出，不按搜索相关度排序
+    query, _ = admin_product_filter(search, category, min_price, max_price)
+    cursor = db.products.find(query, {"description": 0, "images": 0, "image_variants": 0}).sort(LIST_SORT)
+    return export_throttle.response(cursor, product_rows, PRODUCT_EXPORT_FIELDS, export_format, "products")
 
 @router.get("/{product_id}", response_model=ProductResponse)
 async def get_product(product_id: str):
+    cached = catalog_cache.get_product(product_id)
+    if cached is not None:
+        return cached
+    
     db = get_database()
     try:
         # Only show approved products
@@ -179,29 +301,13 @@ async def get_product(product_id: str):
             detail="Product not found"
         )
     
-    return ProductResponse(
-        id=str(product["_id"]),
-        name=product["name"],
-        description=product["description"],
-        price=product["price"],
-        category=product["category"],
-        stock=max(product["stock"], 0),
-        image=product.get("image", "data:image/svg+xml;base64,PHN2ZyB3aWR0aD0iMzAwIiBoZWlnaHQ9IjMwMCIgdmlld0JveD0iMCAwIDMwMCAzMDAiIGZpbGw9Im5vbmUiIHhtbG5zPSJodHRwOi8vd3d3LnczLm9yZy8yMDAwL3N2ZyI+CjxyZWN0IHdpZHRoPSIzMDAiIGhlaWdodD0iMzAwIiBmaWxsPSIjZjBmMGMwIi8+CjxwYXRoIGQ9Ik0xNTAgMTUwIEMxNzcuNjEgMTUwIDE5NSAxMzIuNjEgMTk1IDEwNSBDMTk1IDc3LjM5IDE3Ny42MSA2MCAxNTAgNjAgQzEyMi4zOSA2MCAxMDUgNzcuMzkgMTA1IDEwNSBDMTA1IDEzMi42MSAxMjIuMzkgMTUwIDE1MCAxNTAiIGZpbGw9IiNmZmYiIGZpbGwtb3BhY2l0eT0iMC4yIi8+Cjx0ZXh0IHg9IjE1MCIgeT0iMTY1IiBmb250LWZhbWlseT0iQXJpYWwiIGZvbnQtc2l6ZT0iMTQiIGZpbGw9IiMwMDAiPk5vIEltYWdlPC90ZXh0Pgo8L3N2Zz4="),
-        rating=product.get("rating", 0),
-        numReviews=product.get("numReviews", 0),
-        created_at=product["created_at"],
-        status=product.get("status", "pending"),
-        seller_id=product.get("seller_id"),
-        is_pinned=product.get("is_pinned", False)
-    )
-
-# 确保上传目录存在
-UPLOAD_DIR = "uploads"
-if not os.path.exists(UPLOAD_DIR):
-    os.makedirs(UPLOAD_DIR)
+    product_response = product_to_response(product)
+    catalog_cache.set_product(product_id, product_response)
+    return product_response
 
 @router.post("", response_model=ProductResponse, status_code=status.HTTP_201_CREATED)
 async def create_product(
+    background_tasks: BackgroundTasks,
     name: str = Form(...),
     description: str = Form(...),
     price: float = Form(...),
@@ -216,28 +322,12 @@ async def create_product(
     db = get_database()
     
     # 处理图片上传
-    image_url = "data:image/svg+xml;base64,PHN2ZyB3aWR0aD0iMzAwIiBoZWlnaHQ9IjMwMCIgdmlld0JveD0iMCAwIDMwMCAzMDAiIGZpbGw9Im5vbmUiIHhtbG5zPSJodHRwOi8vd3d3LnczLm9yZy8yMDAwL3N2ZyI+CjxyZWN0IHdpZHRoPSIzMDAiIGhlaWdodD0iMzAwIiBmaWxsPSIjZjBmMGMwIi8+CjxwYXRoIGQ9Ik0xNTAgMTUwIEMxNzcuNjEgMTUwIDE5NSAxMzIuNjEgMTk1IDEwNSBDMTk1IDc3LjM5IDE3Ny42MSA2MCAxNTAgNjAgQzEyMi4zOSA2MCAxMDUgNzcuMzkgMTA1IDEwNSBDMTA1IDEzMi42MSAxMjIuMzkgMTUwIDE1MCAxNTAiIGZpbGw9IiNmZmYiIGZpbGwtb3BhY2l0eT0iMC4yIi8+Cjx0ZXh0IHg9IjE1MCIgeT0iMTY1IiBmb250LWZhbWlseT0iQXJpYWwiIGZvbnQtc2l6ZT0iMTQiIGZpbGw9IiMwMDAiPk5vIEltYWdlPC90ZXh0Pgo8L3N2Zz4="
+    image_url = DEFAULT_IMAGE
     image_urls = []
     
     if images:
-        # 限制最多5张图片
-        images = images[:5]
-        for image in images:
-            # 生成唯一文件名
-            file_extension = os.path.splitext(image.filename)[1]
-            unique_filename = f"{uuid.uuid4()}{file_extension}"
-            file_path = os.path.join(UPLOAD_DIR, unique_filename)
-            
-            # 保存文件
-            try:
-                with open(file_path, "wb") as f:
-                    content = await image.read()
-                    f.write(content)
-                # 生成图片URL
-                img_url = f"/uploads/{unique_filename}"
-                image_urls.append(img_url)
-            except Exception as e:
-                print(f"Error saving image: {e}")
+        # 限制最多5张图片，分块写入磁盘
+        image_urls = await save_uploads(images, max_files=5)
     
     # 如果有上传的图片，使用第一张作为主图
     if image_urls:
@@ -256,29 +346,20 @@ async def create_product(
         "image": image_url,
         "images": image_urls,
         "created_at": datetime.utcnow(),
-        "rating": 0,
-        "numReviews": 0,
+        **empty_rating_stats(),
+        "is_pinned": False,
+        "status": "pending",
         "seller_id": user_id
     }
     
     result = await db.products.insert_one(product_dict)
     created_product = await db.products.find_one({"_id": result.inserted_id})
+    search_index.add(created_product)
+    catalog_cache.invalidate_product(str(created_product["_id"]), created_product)
+    # 缩略图在响应返回后生成
+    background_tasks.add_task(generate_product_variants, str(created_product["_id"]), variant_sources(created_product))
     
-    return ProductResponse(
-        id=str(created_product["_id"]),
-        name=created_product["name"],
-        description=created_product["description"],
-        price=created_product["price"],
-        category=created_product["category"],
-        stock=max(created_product["stock"], 0),
-        image=created_product.get("image", "data:image/svg+xml;base64,PHN2ZyB3aWR0aD0iMzAwIiBoZWlnaHQ9IjMwMCIgdmlld0JveD0iMCAwIDMwMCAzMDAiIGZpbGw9Im5vbmUiIHhtbG5zPSJodHRwOi8vd3d3LnczLm9yZy8yMDAwL3N2ZyI+CjxyZWN0IHdpZHRoPSIzMDAiIGhlaWdodD0iMzAwIiBmaWxsPSIjZjBmMGMwIi8+CjxwYXRoIGQ9Ik0xNTAgMTUwIEMxNzcuNjEgMTUwIDE5NSAxMzIuNjEgMTk1IDEwNSBDMTk1IDc3LjM5IDE3Ny42MSA2MCAxNTAgNjAgQzEyMi4zOSA2MCAxMDUgNzcuMzkgMTA1IDEwNSBDMTA1IDEzMi42MSAxMjIuMzkgMTUwIDE1MCAxNTAiIGZpbGw9IiNmZmYiIGZpbGwtb3BhY2l0eT0iMC4yIi8+Cjx0ZXh0IHg9IjEwMCIgeT0iMTY1IiBmb250LWZhbWlseT0iQXJpYWwiIGZvbnQtc2l6ZT0iMTQiIGZpbGw9IiMwMDAiPk5vIEltYWdlPC90ZXh0Pgo8L3N2Zz4="),
-        rating=created_product.get("rating", 0),
-        numReviews=created_product.get("numReviews", 0),
-        created_at=created_product["created_at"],
-        status=created_product.get("status", "pending"),
-        seller_id=created_product.get("seller_id"),
-        is_pinned=created_product.get("is_pinned", False)
-    )
+    return product_to_response(created_product)
 
 @router.put("/{product_id}/status")
 async def update_product_status(product_id: str, status_data: dict = Body(..., description="状态数据")):
@@ -299,13 +380,13 @@ async def update_product_status(product_id: str, status_data: dict = Body(..., d
     
     try:
         print(f"Updating product status to: {new_status}")
-        result = await db.products.update_one(
+        # Return the previous version so we can tell whether anything changed
+        product = await db.products.find_one_and_update(
             {"_id": ObjectId(product_id)},
-            {"$set": {"status": new_status}}
+            {"$set": {"status": new_status}},
+            projection={"status": 1, "category": 1, "price": 1},
+            return_document=ReturnDocument.BEFORE
         )
-        print(f"Update result: {result}")
-        print(f"Matched count: {result.matched_count}")
-        print(f"Modified count: {result.modified_count}")
     except Exception as e:
         print(f"Error updating product status: {e}")
         raise HTTPException(
@@ -313,15 +394,18 @@ async def update_product_status(product_id: str, status_data: dict = Body(..., d
             detail="Product not found"
         )
     
-    if result.matched_count == 0:
+    if not product:
         print(f"No product found: {product_id}")
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Product not found"
         )
     
+    search_index.set_status(product_id, new_status)
+    catalog_cache.invalidate_product(product_id, {**product, "status": new_status})
+    
     # If no modification but product exists, still return success
-    if result.modified_count == 0:
+    if product.get("status") == new_status:
         print(f"Product status already up to date: {product_id}")
         return {"message": "Product status already up to date"}
     
@@ -332,7 +416,7 @@ async def update_product_status(product_id: str, status_data: dict = Body(..., d
 async def update_product_pin(product_id: str, pin_data: dict = Body(..., description="置顶数据"), user_id: str = Depends(get_current_admin)):
     db = get_database()
     
-    is_pinned = pin_data.get("is_pinned", False)
+    is_pinned = bool(pin_data.get("is_pinned", False))
     
     try:
         # Try to convert product_id to ObjectId
@@ -365,6 +449,8 @@ async def update_product_pin(product_id: str, pin_data: dict = Body(..., descrip
                 detail="Product not found"
             )
         
+        catalog_cache.invalidate_product(product_id, {**product, "is_pinned": is_pinned})
+        
         return {"message": "Product pin status updated successfully"}
     except Exception as e:
         print(f"Error: {e}")
@@ -374,7 +460,7 @@ async def update_product_pin(product_id: str, pin_data: dict = Body(..., descrip
         )
 
 @router.put("/{product_id}", response_model=ProductResponse)
-async def update_product(product_id: str, product_update: ProductUpdate, user_id: str = Depends(get_current_user)):
+async def update_product(product_id: str, product_update: ProductUpdate, background_tasks: BackgroundTasks, user_id: str = Depends(get_current_user), user: dict = Depends(get_current_user_doc)):
     db = get_database()
     try:
         product = await db.products.find_one({"_id": ObjectId(product_id)})
@@ -391,7 +477,6 @@ async def update_product(product_id: str, product_update: ProductUpdate, user_id
         )
     
     # Check if user is the seller or admin
-    user = await db.users.find_one({"_id": ObjectId(user_id)})
     if product.get("seller_id") != user_id and user.get("role") != "admin":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -399,90 +484,214 @@ async def update_product(product_id: str, product_update: ProductUpdate, user_id
         )
     
     update_data = {k: v for k, v in product_update.model_dump().items() if v is not None}
-    await db.products.update_one({"_id": ObjectId(product_id)}, {"$set": update_data})
+    images_changed = "image" in update_data or "images" in update_data
+    update = {"$set": update_data}
+    if images_changed:
+        # 图片变了：缩略图作废，不再引用的原图对应的变体一并移除，之后在后台重新生成
+        image_urls = variant_sources({**product, **update_data})
+        update["$unset"] = {"thumbnail": ""}
+        update["$pull"] = {"image_variants": {"source": {"$nin": image_urls}}}
+        old_refs = Counter(upload_refs(product))
+        new_refs = Counter(upload_refs({**product, **update_data}))
+        # 先给新图加引用再写入文档，文档指向的文件始终有引用
+        await acquire_uploads(list((new_refs - old_refs).elements()))
+    await db.products.update_one({"_id": ObjectId(product_id)}, update)
+
+    # 文档已不再引用旧原图及其变体，这时才释放，引用归零的文件连同变体一起删除
+    if images_changed:
+        await release_uploads(list((old_refs - new_refs).elements()))
     
     updated_product = await db.products.find_one({"_id": ObjectId(product_id)})
-    return ProductResponse(
-        id=str(updated_product["_id"]),
-        name=updated_product["name"],
-        description=updated_product["description"],
-        price=updated_product["price"],
-        category=updated_product["category"],
-        stock=max(updated_product["stock"], 0),
-        image=updated_product.get("image", "data:image/svg+xml;base64,PHN2ZyB3aWR0aD0iMzAwIiBoZWlnaHQ9IjMwMCIgdmlld0JveD0iMCAwIDMwMCAzMDAiIGZpbGw9Im5vbmUiIHhtbG5zPSJodHRwOi8vd3d3LnczLm9yZy8yMDAwL3N2ZyI+CjxyZWN0IHdpZHRoPSIzMDAiIGhlaWdodD0iMzAwIiBmaWxsPSIjZjBmMGMwIi8+CjxwYXRoIGQ9Ik0xNTAgMTUwIEMxNzcuNjEgMTUwIDE5NSAxMzIuNjEgMTk1IDEwNSBDMTk1IDc3LjM5IDE3Ny42MSA2MCAxNTAgNjAgQzEyMi4zOSA2MCAxMDUgNzcuMzkgMTA1IDEwNSBDMTA1IDEzMi42MSAxMjIuMzkgMTUwIDE1MCAxNTAiIGZpbGw9IiNmZmYiIGZpbGwtb3BhY2l0eT0iMC4yIi8+Cjx0ZXh0IHg9IjE1MCIgeT0iMTY1IiBmb250LWZhbWlseT0iQXJpYWwiIGZvbnQtc2l6ZT0iMTQiIGZpbGw9IiMwMDAiPk5vIEltYWdlPC90ZXh0Pgo8L3N2Zz4="),
-        rating=updated_product.get("rating", 0),
-        numReviews=updated_product.get("numReviews", 0),
-        created_at=updated_product["created_at"],
-        is_pinned=updated_product.get("is_pinned", False)
-    )
+    search_index.add(updated_product)
+    catalog_cache.invalidate_product(product_id, updated_product)
+    if images_changed:
+        background_tasks.add_task(generate_product_variants, product_id, image_urls)
+    return product_to_response(updated_product)
 
-@router.delete("/{product_id}")
-async def delete_product(product_id: str, user_id: str = Depends(get_current_user)):
+def owner_filter(user: dict, user_id: str) -> dict:
+    """Products this user may modify: admins any, sellers only their own"""
+    if user and user.get("role") == "admin":
+        return {}
+    return {"seller_id": user_id}
+
+@router.post("/bulk-delete")
+async def bulk_delete_products(bulk: ProductBulkDelete, user_id: str = Depends(get_current_user), user: dict = Depends(get_current_user_doc)):
     db = get_database()
     
-    print(f"Delete product request received: product_id={product_id}, user_id={user_id}")
+    object_ids = []
+    invalid_ids = []
+    for product_id in dict.fromkeys(bulk.product_ids):
+        if ObjectId.is_valid(product_id):
+            object_ids.append(ObjectId(product_id))
+        else:
+            invalid_ids.append(product_id)
+    
+    query = {"_id": {"$in": object_ids}, **owner_filter(user, user_id)}
+    products = await db.products.find(
+        query, {"status": 1, "category": 1, "price": 1, "image": 1, "images": 1}
+    ).to_list(length=len(object_ids))
+    result = await db.products.delete_many({"_id": {"$in": [product["_id"] for product in products]}})
+    await release_uploads([name for product in products for name in upload_refs(product)])
+    
+    deleted_ids = set()
+    for product in products:
+        product_id = str(product["_id"])
+        deleted_ids.add(product_id)
+        search_index.remove(product_id)
+        catalog_cache.invalidate_product(product_id, product)
+    
+    return {
+        "deleted_count": result.deleted_count,
+        "deleted": sorted(deleted_ids),
+        # Missing products and products owned by someone else are not told apart here
+        "not_deleted": [str(object_id) for object_id in object_ids if str(object_id) not in deleted_ids],
+        "invalid": invalid_ids
+    }
+
+MODERATION_PROJECTION = {"status": 1, "category": 1, "price": 1, "is_pinned": 1}
+
+def moderation_filter(criteria: ProductModerationFilter) -> dict:
+    query = {}
+    for field in ("status", "seller_id", "category"):
+        value = getattr(criteria, field)
+        if value is not None:
+            query[field] = value
+    # 旧商品可能没有 status 字段，与其他地方一样视为 pending
+    if criteria.status == "pending":
+        query["status"] = {"$in": ["pending", None]}
+    created_at = {}
+    for operator, value in (("$gte", criteria.created_from), ("$lt", criteria.created_to)):
+        if value is not None:
+            # created_at 以无时区的 UTC 存储
+            if value.tzinfo is not None:
+                value = value.astimezone(timezone.utc).replace(tzinfo=None)
+            created_at[operator] = value
+    if created_at:
+        query["created_at"] = created_at
+    return query
+
+@router.post("/bulk-moderate")
+async def bulk_moderate_products(bulk: ProductBulkModerate, user_id: str = Depends(get_current_admin)):
+    """Set status and/or pin on many products with one update_many.
+
+    Targets are either `product_ids` or a `filter`. With a filter only
+    products that still need the change are picked, at most `limit` per call,
+    and `remaining` tells whether to call again.
+    """
+    if (bulk.product_ids is None) == (bulk.filter is None):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Provide either product_ids or filter"
+        )
+    changes = {}
+    if bulk.status is not None:
+        changes["status"] = bulk.status
+    if bulk.is_pinned is not None:
+        changes["is_pinned"] = bulk.is_pinned
+    if not changes:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Nothing to change: set status and/or is_pinned"
+        )
+    
+    db = get_database()
+    # 只有至少一个字段与目标值不同的商品才需要写
+    needs_change = {"$or": [{field: {"$ne": value}} for field, value in changes.items()]}
+    
+    invalid_ids = []
+    remaining = False
+    if bulk.product_ids is not None:
+        object_ids = []
+        for product_id in dict.fromkeys(bulk.product_ids):
+            if ObjectId.is_valid(product_id):
+                object_ids.append(ObjectId(product_id))
+            else:
+                invalid_ids.append(product_id)
+        products = await db.products.find(
+            {"_id": {"$in": object_ids}}, MODERATION_PROJECTION
+        ).to_list(length=len(object_ids))
+    else:
+        query = {"$and": [moderation_filter(bulk.filter), needs_change]}
+        products = await db.products.find(query, MODERATION_PROJECTION).sort(
+            [("created_at", ASCENDING), ("_id", ASCENDING)]
+        ).limit(bulk.limit + 1).to_list(length=bulk.limit + 1)
+        remaining = len(products) > bulk.limit
+        products = products[:bulk.limit]
+        object_ids = [product["_id"] for product in products]
+    
+    to_change = [
+        product["_id"] for product in products
+        if any(product.get(field) != value for field, value in changes.items())
+    ]
+    updated_count = 0
+    if to_change:
+        result = await db.products.update_many(
+            {"_id": {"$in": to_change}, **needs_change},
+            {"$set": changes}
+        )
+        updated_count = result.modified_count
+    
+    # 搜索索引与目录缓存一次性失效
+    changed = {}
+    for product in products:
+        if product["_id"] in to_change:
+            product_id = str(product["_id"])
+            changed[product_id] = {**product, **changes}
+            if "status" in changes:
+                search_index.set_status(product_id, changes["status"])
+    catalog_cache.invalidate_products(changed)
+    
+    found = {product["_id"] for product in products}
+    results = []
+    for object_id in object_ids:
+        if object_id not in found:
+            outcome = "not_found"
+        elif str(object_id) in changed:
+            outcome = "updated"
+        else:
+            outcome = "unchanged"
+        results.append({"id": str(object_id), "outcome": outcome})
+    results.extend({"id": product_id, "outcome": "invalid"} for product_id in invalid_ids)
+    
+    return {
+        "matched": len(products),
+        "updated_count": updated_count,
+        "results": results,
+        "remaining": remaining
+    }
+
+@router.delete("/{product_id}")
+async def delete_product(product_id: str, user_id: str = Depends(get_current_user), user: dict = Depends(get_current_user_doc)):
+    db = get_database()
     
     try:
-        # Get user to check role
-        user = await db.users.find_one({"_id": ObjectId(user_id)})
-        if not user:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="User not found"
-            )
-        
-        # Get all products
-        all_products = await db.products.find({}).to_list(length=100)
-        print(f"All products count: {len(all_products)}")
-        
-        # Find the product to delete
-        product_to_delete = None
-        for product in all_products:
-            print(f"  Checking product: {product['name']}, ID: {product['_id']}, Type: {type(product['_id'])}")
-            # Check if product ID matches (either as ObjectId or string)
-            if str(product['_id']) == product_id:
-                product_to_delete = product
-                print(f"  Found product to delete: {product['name']}")
-                break
-        
-        if not product_to_delete:
-            print(f"Product not found: {product_id}")
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Product not found"
-            )
-        
-        # Check if user is the seller or admin
-        seller_id = product_to_delete.get("seller_id")
-        user_role = user.get("role")
-        print(f"Seller ID: {seller_id}, User ID: {user_id}, User Role: {user_role}")
-        
-        if seller_id != user_id and user_role != "admin":
-            print(f"Not authorized to delete product: seller_id={seller_id}, user_id={user_id}, user_role={user_role}")
+        product_object_id = ObjectId(product_id)
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Product not found"
+        )
+    
+    # The user comes from the auth cache and ownership is part of the filter,
+    # so lookup, authorization and delete are one round trip
+    product = await db.products.find_one_and_delete(
+        {"_id": product_object_id, **owner_filter(user, user_id)},
+        projection={"status": 1, "category": 1, "price": 1, "image": 1, "images": 1}
+    )
+    
+    if not product:
+        # Only on failure: find out whether the product exists at all
+        if await db.products.find_one({"_id": product_object_id}, {"_id": 1}):
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Not authorized to delete this product"
             )
-        
-        # Delete the product
-        result = await db.products.delete_one({"_id": product_to_delete["_id"]})
-        print(f"Delete result: {result}")
-        print(f"Deleted count: {result.deleted_count}")
-        
-        if result.deleted_count == 0:
-            print(f"No product deleted: {product_id}")
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Product not found"
-            )
-        
-        print(f"Product deleted successfully: {product_id}")
-        return {"message": "Product deleted successfully"}
-    except Exception as e:
-        print(f"Error deleting product: {e}")
-        import traceback
-        traceback.print_exc()
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error deleting product: {str(e)}"
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Product not found"
         )
+    
+    search_index.remove(product_id)
+    catalog_cache.invalidate_product(product_id, product)
+    await release_uploads(upload_refs(product))
+    return {"message": "Product deleted successfully"}
@@ -1,39 +1,142 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from typing import List
-from models import ReviewCreate, ReviewResponse
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
+from typing import List, Optional, Literal
+from models import ReviewCreate, ReviewResponse, ReviewSummary
 from database import get_database
 from auth import get_current_user
+from routers.products import hydrate_products
+from ratings import add_review, remove_review, rating_distribution
+from cache import catalog_cache, TTLCache
+from config import settings
+from pagination import fetch_page, set_next_cursor
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+import asyncio
 from bson import ObjectId
 from datetime import datetime
 
 router = APIRouter(prefix="/api/reviews", tags=["Reviews"])
 
+# 评论排序方式；末尾的 _id 保证游标位置唯一
+REVIEW_SORTS = {
+    "recent": [("created_at", -1), ("_id", -1)],
+    "helpful": [("helpful_count", -1), ("created_at", -1), ("_id", -1)]
+}
+SUMMARY_LATEST_COUNT = 5
+
+review_summary_cache = TTLCache(settings.REVIEW_SUMMARY_CACHE_MAX_ENTRIES, settings.REVIEW_SUMMARY_CACHE_TTL_SECONDS)
+
+def review_to_response(review: dict) -> ReviewResponse:
+    return ReviewResponse(
+        id=str(review["_id"]),
+        user_id=review["user_id"],
+        product_id=review["product_id"],
+        rating=review["rating"],
+        comment=review["comment"],
+        helpful_count=review.get("helpful_count", 0),
+        created_at=review["created_at"]
+    )
+
+async def ensure_product_exists(product_id: str):
+    db = get_database()
+    if not ObjectId.is_valid(product_id) or not await db.products.find_one({"_id": ObjectId(product_id)}, {"_id": 1}):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Product not found"
+        )
+
 @router.get("/product/{product_id}", response_model=List[ReviewResponse])
-async def get_product_reviews(product_id: str):
+async def get_product_reviews(
+    product_id: str,
+    response: Response,
+    sort: Literal["recent", "helpful"] = "recent",
+    limit: int = Query(100, ge=1, le=100),
+    cursor: Optional[str] = None
+):
     db = get_database()
+    reviews, next_cursor = await fetch_page(
+        db.reviews, {"product_id": product_id}, REVIEW_SORTS[sort], limit, cursor
+    )
+    
+    # 只有第一页为空时才需要区分“没有评论”和“商品不存在”
+    if not reviews and not cursor:
+        await ensure_product_exists(product_id)
+    
+    set_next_cursor(response, next_cursor)
+    return [review_to_response(review) for review in reviews]
+
+@router.get("/product/{product_id}/summary", response_model=ReviewSummary)
+async def get_review_summary(product_id: str):
+    summary = review_summary_cache.get(product_id)
+    if summary is not None:
+        return summary
     
-    # Check if product exists
-    product = await db.products.find_one({"_id": ObjectId(product_id)})
+    if not ObjectId.is_valid(product_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Product not found"
+        )
+    
+    db = get_database()
+    # 统计信息直接读商品上维护的字段，与最新评论并发查询
+    product, latest = await asyncio.gather(
+        db.products.find_one({"_id": ObjectId(product_id)}, {"rating": 1, "numReviews": 1, "ratingDist": 1}),
+        db.reviews.find({"product_id": product_id})
+            .sort(REVIEW_SORTS["recent"]).limit(SUMMARY_LATEST_COUNT).to_list(length=SUMMARY_LATEST_COUNT)
+    )
     if not product:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Product not found"
         )
     
-    reviews = await db.reviews.find({"product_id": product_id}).to_list(length=100)
-    reviews.sort(key=lambda x: x["created_at"], reverse=True)
+    summary = ReviewSummary(
+        product_id=product_id,
+        count=product.get("numReviews", 0),
+        average=product.get("rating", 0),
+        distribution=rating_distribution(product),
+        latest=[review_to_response(review) for review in latest]
+    )
+    review_summary_cache.set(product_id, summary)
+    return summary
+
+@router.post("/{review_id}/helpful")
+async def mark_review_helpful(review_id: str, user_id: str = Depends(get_current_user)):
+    db = get_database()
+    if not ObjectId.is_valid(review_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Review not found"
+        )
+    
+    review = await db.reviews.find_one({"_id": ObjectId(review_id)}, {"product_id": 1, "helpful_count": 1})
+    if not review:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Review not found"
+        )
     
-    return [
-        ReviewResponse(
-            id=str(review["_id"]),
-            user_id=review["user_id"],
-            product_id=review["product_id"],
-            rating=review["rating"],
-            comment=review["comment"],
-            created_at=review["created_at"]
+    # 投票记在单独的集合里，评论文档不随票数增长；唯一索引保证每个用户只计一次
+    try:
+        await db.review_helpful.insert_one({"review_id": review_id, "user_id": user_id, "created_at": datetime.utcnow()})
+    except DuplicateKeyError:
+        return {"helpful_count": review.get("helpful_count", 0)}
+    
+    review = await db.reviews.find_one_and_update(
+        {"_id": ObjectId(review_id)},
+        {"$inc": {"helpful_count": 1}},
+        projection={"product_id": 1, "helpful_count": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if not review:
+        # 评论在投票期间被删除
+        await db.review_helpful.delete_one({"review_id": review_id, "user_id": user_id})
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Review not found"
         )
-        for review in reviews
-    ]
+    review_summary_cache.pop(review["product_id"])
+    
+    return {"helpful_count": review.get("helpful_count", 0)}
 
 @router.post("", response_model=ReviewResponse, status_code=status.HTTP_201_CREATED)
 async def create_review(review: ReviewCreate, user_id: str = Depends(get_current_user)):
@@ -42,7 +145,7 @@ async def create_review(review: ReviewCreate, user_id: str = Depends(get_current
     
     try:
         # Check if product exists
-        product = await db.products.find_one({"_id": ObjectId(review.product_id)})
+        product = await db.products.find_one({"_id": ObjectId(review.product_id)}, {"_id": 1})
         if not product:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -52,34 +155,14 @@ async def create_review(review: ReviewCreate, user_id: str = Depends(get_current
         # Create review with current user_id
         review_dict = review.model_dump()
         review_dict["user_id"] = user_id
+        review_dict["helpful_count"] = 0
         review_dict["created_at"] = datetime.utcnow()
         
-        result = await db.reviews.insert_one(review_dict)
-        created_review = await db.reviews.find_one({"_id": result.inserted_id})
-        
-        # Update product rating and numReviews
-        reviews = await db.reviews.find({"product_id": review.product_id}).to_list(length=100)
-        total_rating = sum(r["rating"] for r in reviews)
-        avg_rating = total_rating / len(reviews)
-        
-        await db.products.update_one(
-            {"_id": ObjectId(review.product_id)},
-            {
-                "$set": {
-                    "rating": round(avg_rating, 1),
-                    "numReviews": len(reviews)
-                }
-            }
-        )
+        created_review = await add_review(review_dict)
+        catalog_cache.invalidate_product(review.product_id)
+        review_summary_cache.pop(review.product_id)
         
-        return ReviewResponse(
-            id=str(created_review["_id"]),
-            user_id=created_review["user_id"],
-            product_id=created_review["product_id"],
-            rating=created_review["rating"],
-            comment=created_review["comment"],
-            created_at=created_review["created_at"]
-        )
+        return review_to_response(created_review)
     except Exception as e:
         # Log the error
         print(f"Error creating review: {str(e)}")
@@ -94,47 +177,28 @@ async def create_review(review: ReviewCreate, user_id: str = Depends(get_current
 async def delete_review(review_id: str, user_id: str = Depends(get_current_user)):
     db = get_database()
     
-    try:
-        review = await db.reviews.find_one({"_id": ObjectId(review_id)})
-    except:
+    if not ObjectId.is_valid(review_id):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Review not found"
         )
     
+    # 只删除本人的评论；未命中时再区分不存在与无权限
+    review = await remove_review({"_id": ObjectId(review_id), "user_id": user_id})
     if not review:
+        if await db.reviews.find_one({"_id": ObjectId(review_id)}, {"_id": 1}):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Not authorized to delete this review"
+            )
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Review not found"
         )
     
-    # Check if user is the reviewer
-    if review["user_id"] != user_id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Not authorized to delete this review"
-        )
-    
-    product_id = review["product_id"]
-    await db.reviews.delete_one({"_id": ObjectId(review_id)})
-    
-    # Update product rating and numReviews
-    reviews = await db.reviews.find({"product_id": product_id}).to_list(length=100)
-    if reviews:
-        total_rating = sum(r["rating"] for r in reviews)
-        avg_rating = total_rating / len(reviews)
-    else:
-        avg_rating = 0
-    
-    await db.products.update_one(
-        {"_id": ObjectId(product_id)},
-        {
-            "$set": {
-                "rating": round(avg_rating, 1),
-                "numReviews": len(reviews)
-            }
-        }
-    )
+    await db.review_helpful.delete_many({"review_id": review_id})
+    catalog_cache.invalidate_product(review["product_id"])
+    review_summary_cache.pop(review["product_id"])
     
     return {"message": "Review deleted successfully"}
 
@@ -145,15 +209,13 @@ async def get_my_reviews(user_id: str = Depends(get_current_user)):
     reviews = await db.reviews.find({"user_id": user_id}).to_list(length=100)
     reviews.sort(key=lambda x: x["created_at"], reverse=True)
     
-    # Get product names for each review
+    # Get product names for all reviews in one query
+    products = await hydrate_products([review["product_id"] for review in reviews], projection={"name": 1})
+    
     review_list = []
     for review in reviews:
-        # Get product details
-        try:
-            product = await db.products.find_one({"_id": ObjectId(review["product_id"])})
-            product_name = product.get("name", "未知商品") if product else "未知商品"
-        except:
-            product_name = "未知商品"
+        product = products.get(str(review["product_id"]))
+        product_name = product.get("name", "未知商品") if product else "未知商品"
         
         review_dict = {
             "id": str(review["_id"]),
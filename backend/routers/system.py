@@ -1,39 +1,61 @@
-from fastapi import APIRouter, Depends, Body
-from auth import get_current_admin
+from fastapi import APIRouter, Depends, Body, HTTPException, status
+from auth import get_current_admin, user_cache, password_hasher
 from database import get_database
+from indexes import get_index_drift
+from cache import catalog_cache
+from routers.favorites import favorite_id_cache
+from cart_store import cart_store
+from routers.reviews import review_summary_cache
+from static_files import upload_hot_cache
+from exports import export_throttle
+from scheduler import scheduler
+from config import settings
+from maintenance import CLEANUP_JOB
 from datetime import datetime, timedelta
 from bson import ObjectId
+import asyncio
 
 router = APIRouter(prefix="/api/system", tags=["System"])
+ORDER_STATUSES = ["pending", "processing", "shipped", "delivered", "cancelled"]
+TOP_PRODUCTS_LIMIT = 10
+
+def _month_start(year: int, month: int) -> datetime:
+    # month 可以越界（<=0），换算到正确的年份
+    year += (month - 1) // 12
+    month = (month - 1) % 12 + 1
+    return datetime(year, month, 1)
+
 @router.get("/status")
 async def get_system_status(admin_id: str = Depends(get_current_admin)):
     db = get_database()
-    
-    # Get total users
-    total_users = await db.users.count_documents({})
-    
-    # Get total products
-    total_products = await db.products.count_documents({})
-    
-    # Get total orders
-    total_orders = await db.orders.count_documents({})
-    
-    # Get total revenue (sum of all order total prices)
-    orders = await db.orders.find().to_list(length=1000)
-    total_revenue = sum(order.get("total_price", 0) for order in orders)
-    
-    # Get recent orders (last 7 days)
     seven_days_ago = datetime.utcnow() - timedelta(days=7)
-    recent_orders = await db.orders.count_documents({"created_at": {"$gte": seven_days_ago}})
     
-    # Get order status counts
-    status_counts = {
-        "pending": await db.orders.count_documents({"status": "pending"}),
-        "processing": await db.orders.count_documents({"status": "processing"}),
-        "shipped": await db.orders.count_documents({"status": "shipped"}),
-        "delivered": await db.orders.count_documents({"status": "delivered"}),
-        "cancelled": await db.orders.count_documents({"status": "cancelled"})
-    }
+    # 全量汇总在一次聚合里完成，不再把订单拉回 Python 求和
+    pipeline = [
+        {"$facet": {
+            "totals": [
+                {"$group": {"_id": None, "count": {"$sum": 1}, "revenue": {"$sum": {"$ifNull": ["$total_price", 0]}}}}
+            ],
+            "statuses": [
+                {"$group": {"_id": "$status", "count": {"$sum": 1}}}
+            ]
+        }}
+    ]
+    
+    # 查询互不依赖，并发执行；近 7 天订单数单独计数，$facet 内的 $match 用不上 created_at 索引
+    total_users, total_products, order_stats, recent_orders = await asyncio.gather(
+        db.users.count_documents({}),
+        db.products.count_documents({}),
+        db.orders.aggregate(pipeline).to_list(length=1),
+        db.orders.count_documents({"created_at": {"$gte": seven_days_ago}})
+    )
+    order_stats = order_stats[0]
+    totals = order_stats["totals"][0] if order_stats["totals"] else {"count": 0, "revenue": 0}
+    
+    status_counts = {order_status: 0 for order_status in ORDER_STATUSES}
+    for entry in order_stats["statuses"]:
+        if entry["_id"] in status_counts:
+            status_counts[entry["_id"]] = entry["count"]
     
     return {
         "status": "operational",
@@ -41,8 +63,8 @@ async def get_system_status(admin_id: str = Depends(get_current_admin)):
         "statistics": {
             "total_users": total_users,
             "total_products": total_products,
-            "total_orders": total_orders,
-            "total_revenue": round(total_revenue, 2),
+            "total_orders": totals["count"],
+            "total_revenue": round(totals["revenue"], 2),
             "recent_orders": recent_orders,
             "order_statuses": status_counts
         }
@@ -52,59 +74,73 @@ async def get_system_status(admin_id: str = Depends(get_current_admin)):
 async def get_system_statistics(admin_id: str = Depends(get_current_admin)):
     db = get_database()
     
-    # Get monthly sales data for the last 6 months
-    sales_data = []
+    # Monthly sales for the current and previous five calendar months
     now = datetime.utcnow()
+    months = [_month_start(now.year, now.month - i) for i in range(6)]
+    
+    # 月度统计以 created_at 范围 $match 开头，可走索引；放进 $facet 则只能全表扫描
+    monthly_pipeline = [
+        {"$match": {"created_at": {"$gte": months[-1]}}},
+        {"$group": {
+            "_id": {"$dateToString": {"format": "%Y-%m", "date": "$created_at"}},
+            "orders": {"$sum": 1},
+            "revenue": {"$sum": {"$ifNull": ["$total_price", 0]}}
+        }}
+    ]
+    
+    top_products_pipeline = [
+        {"$unwind": "$items"},
+        # 购物车下单存的是字符串 id，旧数据里可能是 ObjectId，统一成字符串再分组
+        {"$group": {
+            "_id": {"$toString": "$items.product_id"},
+            "quantity": {"$sum": {"$ifNull": ["$items.quantity", 0]}},
+            "revenue": {"$sum": {"$multiply": [
+                {"$ifNull": ["$items.price", 0]},
+                {"$ifNull": ["$items.quantity", 0]}
+            ]}}
+        }},
+        {"$match": {"_id": {"$ne": None}}},
+        {"$sort": {"quantity": -1, "_id": 1}},
+        {"$lookup": {
+            "from": "products",
+            "let": {"product_id": {"$convert": {"input": "$_id", "to": "objectId", "onError": None, "onNull": None}}},
+            "pipeline": [
+                {"$match": {"$expr": {"$eq": ["$_id", "$$product_id"]}}},
+                {"$project": {"name": 1, "category": 1}}
+            ],
+            "as": "product"
+        }},
+        # 已删除的商品不参与排行
+        {"$unwind": "$product"},
+        {"$limit": TOP_PRODUCTS_LIMIT}
+    ]
+    
+    monthly_entries, top_entries = await asyncio.gather(
+        db.orders.aggregate(monthly_pipeline).to_list(length=None),
+        db.orders.aggregate(top_products_pipeline).to_list(length=TOP_PRODUCTS_LIMIT)
+    )
     
-    for i in range(6):
-        month_start = (now - timedelta(days=i*30)).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        month_end = (month_start + timedelta(days=30)).replace(hour=23, minute=59, second=59, microsecond=999999)
-        
-        month_orders = await db.orders.find({
-            "created_at": {"$gte": month_start, "$lte": month_end}
-        }).to_list(length=1000)
-        
-        month_revenue = sum(order.get("total_price", 0) for order in month_orders)
-        
+    monthly = {entry["_id"]: entry for entry in monthly_entries}
+    sales_data = []
+    for month_start in months:
+        month = month_start.strftime("%Y-%m")
+        entry = monthly.get(month, {"orders": 0, "revenue": 0})
         sales_data.append({
-            "month": month_start.strftime("%Y-%m"),
-            "orders": len(month_orders),
-            "revenue": round(month_revenue, 2)
+            "month": month,
+            "orders": entry["orders"],
+            "revenue": round(entry["revenue"], 2)
         })
     
-    # Get top selling products
-    product_sales = {}
-    all_orders = await db.orders.find().to_list(length=1000)
-    
-    for order in all_orders:
-        for item in order.get("items", []):
-            product_id = item.get("product_id")
-            if product_id:
-                if product_id not in product_sales:
-                    product_sales[product_id] = {
-                        "quantity": 0,
-                        "revenue": 0
-                    }
-                product_sales[product_id]["quantity"] += item.get("quantity", 0)
-                product_sales[product_id]["revenue"] += item.get("price", 0) * item.get("quantity", 0)
-    
-    # Convert to list and sort
-    top_products = []
-    for product_id, sales in product_sales.items():
-        # Get product details
-        product = await db.products.find_one({"_id": product_id})
-        if product:
-            top_products.append({
-                "id": str(product_id),
-                "name": product.get("name"),
-                "category": product.get("category"),
-                "quantity_sold": sales["quantity"],
-                "revenue": round(sales["revenue"], 2)
-            })
-    
-    # Sort by quantity sold
-    top_products.sort(key=lambda x: x["quantity_sold"], reverse=True)
-    top_products = top_products[:10]  # Top 10
+    top_products = [
+        {
+            "id": entry["_id"],
+            "name": entry["product"].get("name"),
+            "category": entry["product"].get("category"),
+            "quantity_sold": entry["quantity"],
+            "revenue": round(entry["revenue"], 2)
+        }
+        for entry in top_entries
+    ]
     
     return {
         "monthly_sales": sales_data,
@@ -142,6 +178,27 @@ async def get_today_stats(admin_id: str = Depends(get_current_admin)):
         }
     }
 
+@router.get("/indexes")
+async def get_indexes(admin_id: str = Depends(get_current_admin)):
+    drift = await get_index_drift()
+    return {
+        "in_sync": all(collection["in_sync"] for collection in drift.values()),
+        "collections": drift
+    }
+
+@router.get("/metrics")
+async def get_metrics(admin_id: str = Depends(get_current_admin)):
+    return {
+        "catalog_cache": catalog_cache.stats(),
+        "user_cache": user_cache.stats(),
+        "favorite_id_cache": favorite_id_cache.stats(),
+        "cart_store": cart_store.stats(),
+        "review_summary_cache": review_summary_cache.stats(),
+        "upload_hot_cache": upload_hot_cache.stats() if upload_hot_cache else None,
+        "exports": export_throttle.stats(),
+        "password_hasher": password_hasher.stats()
+    }
+
 @router.get("/announcements")
 async def get_announcements(admin_id: str = Depends(get_current_admin)):
     db = get_database()
@@ -229,31 +286,38 @@ async def delete_announcement(announcement_id: str, admin_id: str = Depends(get_
     
     return {"message": "Announcement deleted successfully"}
 
-@router.post("/cleanup")
+async def _trigger_job(name: str) -> dict:
+    if name not in scheduler.job_names:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
+        )
+    # 调度器没有启动时触发了也不会有人执行，直接告知而不是返回 202
+    if not settings.SCHEDULER_ENABLED:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Background scheduler is disabled (SCHEDULER_ENABLED=false)"
+        )
+    job = next(job for job in await scheduler.status() if job["name"] == name)
+    if job["running"]:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Job is already running"
+        )
+    await scheduler.trigger(name)
+    return next(job for job in await scheduler.status() if job["name"] == name)
+
+@router.post("/cleanup", status_code=status.HTTP_202_ACCEPTED)
 async def cleanup_invalid_data(admin_id: str = Depends(get_current_admin)):
-    db = get_database()
-    
-    # Cleanup incomplete orders (older than 24 hours)
-    twenty_four_hours_ago = datetime.utcnow() - timedelta(hours=24)
-    incomplete_orders = await db.orders.delete_many(
-        {"status": "pending", "created_at": {"$lt": twenty_four_hours_ago}}
-    )
-    
-    # Cleanup invalid user accounts (no email or name)
-    invalid_users = await db.users.delete_many(
-        {"$or": [{"email": {"$exists": False}}, {"name": {"$exists": False}}]}
-    )
-    
-    # Cleanup products with no name or price
-    invalid_products = await db.products.delete_many(
-        {"$or": [{"name": {"$exists": False}}, {"price": {"$exists": False}}]}
-    )
-    
-    return {
-        "message": "Data cleanup completed",
-        "cleaned": {
-            "incomplete_orders": incomplete_orders.deleted_count,
-            "invalid_users": invalid_users.deleted_count,
-            "invalid_products": invalid_products.deleted_count
-        }
-    }
+    # 清理在后台分批执行，进度见 GET /api/system/jobs
+    job = await _trigger_job(CLEANUP_JOB)
+    return {"message": "Data cleanup scheduled", "job": job}
+
+@router.get("/jobs")
+async def get_jobs(admin_id: str = Depends(get_current_admin)):
+    return {"scheduler_enabled": settings.SCHEDULER_ENABLED, "jobs": await scheduler.status()}
+
+@router.post("/jobs/{name}/run", status_code=status.HTTP_202_ACCEPTED)
+async def run_job(name: str, admin_id: str = Depends(get_current_admin)):
+    job = await _trigger_job(name)
+    return {"message": "Job scheduled", "job": job}
@@ -2,7 +2,7 @@ from fastapi import APIRouter, Depends, HTTPException, status, Body
 from typing import List, Optional
 from models import UserResponse
 from database import get_database
-from auth import get_current_admin, get_current_user
+from auth import get_current_admin, get_current_user, evict_user
 from bson import ObjectId
 
 router = APIRouter(prefix="/api/users", tags=["Users"])
@@ -72,9 +72,10 @@ async def update_user_role(user_id: str, role_data: dict = Body(...), admin_id:
             detail="User not found"
         )
     
+    evict_user(user_id)
+    
     # Check if user exists (even if no changes were made)
-    user_exists = await db.users.find_one({"_id": ObjectId(user_id)})
-    if not user_exists:
+    if result.matched_count == 0:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
@@ -94,6 +95,8 @@ async def delete_user(user_id: str, admin_id: str = Depends(get_current_admin)):
             detail="User not found"
         )
     
+    evict_user(user_id)
+    
     if result.deleted_count == 0:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -124,9 +127,10 @@ async def update_user_status(user_id: str, status_data: dict = Body(...), admin_
             detail="User not found"
         )
     
+    evict_user(user_id)
+    
     # Check if user exists (even if no changes were made)
-    user_exists = await db.users.find_one({"_id": ObjectId(user_id)})
-    if not user_exists:
+    if result.matched_count == 0:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
@@ -172,6 +176,8 @@ async def update_profile(
             )
         raise
     
+    evict_user(user_id)
+    
     # Check if user exists (even if no changes were made)
     user_exists = await db.users.find_one({"_id": ObjectId(user_id)})
     if not user_exists:
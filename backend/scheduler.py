@@ -0,0 +1,211 @@
+import asyncio
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from database import get_database
+from config import settings
+
+class JobContext:
+    """Handed to a running job to report progress and pace itself"""
+
+    def __init__(self, scheduler: "Scheduler", name: str):
+        self._scheduler = scheduler
+        self.name = name
+        self.progress = {}
+
+    async def checkpoint(self, **progress):
+        """Record progress, renew the lease and pause before the next batch.
+
+        Raises LeaseLost when another worker has taken the job over, so the
+        job stops instead of running twice.
+        """
+        self.progress.update(progress)
+        await self._scheduler.renew(self.name, self.progress)
+        await asyncio.sleep(self._scheduler.batch_pause)
+
+class LeaseLost(Exception):
+    pass
+
+class Scheduler:
+    """Runs registered maintenance jobs in the background of the API process.
+
+    Job state lives in the `jobs` collection: a worker runs a job only after
+    taking its lease there, so with several workers (or instances) each due
+    run happens once. The lease is renewed at every checkpoint and expires if
+    the worker dies, letting another worker pick the job up.
+    """
+
+    def __init__(self, poll_seconds: float, lease_seconds: float, batch_pause: float):
+        self.poll_seconds = poll_seconds
+        self.lease_seconds = lease_seconds
+        self.batch_pause = batch_pause
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._jobs = {}
+        self._task = None
+        self._wake = asyncio.Event()
+        self._running = set()
+
+    def register(self, name: str, func, interval_seconds: float):
+        """Register `func(ctx)`; it runs every interval_seconds (0 = only when triggered)"""
+        self._jobs[name] = {"func": func, "interval": interval_seconds}
+
+    @property
+    def job_names(self) -> list:
+        return list(self._jobs)
+
+    async def _acquire(self, name: str) -> bool:
+        db = get_database()
+        now = datetime.utcnow()
+        interval = self._jobs[name]["interval"]
+        due = [{"next_run_at": {"$lte": now}}]
+        if interval:
+            # 定时任务第一次启动时立即运行；仅手动触发的任务要等 trigger 写入 next_run_at
+            due.append({"next_run_at": None})
+        query = {
+            "_id": name,
+            "$and": [
+                {"$or": [{"lease_until": {"$lt": now}}, {"lease_until": None}]},
+                {"$or": due}
+            ]
+        }
+        try:
+            job = await db.jobs.find_one_and_update(
+                query,
+                {"$set": {
+                    "owner": self.owner,
+                    "lease_until": now + timedelta(seconds=self.lease_seconds),
+                    "last_started_at": now,
+                    "progress": {}
+                }},
+                upsert=bool(interval),
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # 文档已存在但条件不满足：租约被别的 worker 持有，或还没到下次运行时间
+            return False
+        return job is not None
+
+    async def renew(self, name: str, progress: dict):
+        db = get_database()
+        result = await db.jobs.update_one(
+            {"_id": name, "owner": self.owner},
+            {"$set": {
+                "lease_until": datetime.utcnow() + timedelta(seconds=self.lease_seconds),
+                "progress": progress
+            }}
+        )
+        if not result.matched_count:
+            raise LeaseLost(name)
+
+    async def _finish(self, name: str, progress: dict, error: str = None):
+        db = get_database()
+        now = datetime.utcnow()
+        interval = self._jobs[name]["interval"]
+        await db.jobs.update_one(
+            {"_id": name, "owner": self.owner},
+            {"$set": {
+                "lease_until": None,
+                "last_finished_at": now,
+                "last_result": progress,
+                "last_error": error,
+                "progress": progress,
+                "next_run_at": now + timedelta(seconds=interval) if interval else None
+            }}
+        )
+
+    async def run_job(self, name: str) -> bool:
+        """Run one job here if it is due and its lease can be taken; returns whether it ran"""
+        if name in self._running or not await self._acquire(name):
+            return False
+
+        self._running.add(name)
+        context = JobContext(self, name)
+        try:
+            print(f"Job {name} started")
+            await self._jobs[name]["func"](context)
+        except LeaseLost:
+            print(f"Job {name} lost its lease, stopping")
+            return False
+        except asyncio.CancelledError:
+            # 关闭时中断：记录进度，下次从头继续（各批次本身是幂等的）
+            await self._finish(name, context.progress, "interrupted by shutdown")
+            raise
+        except Exception as e:
+            print(f"Job {name} failed: {e}")
+            await self._finish(name, context.progress, str(e))
+            return True
+        finally:
+            self._running.discard(name)
+
+        await self._finish(name, context.progress)
+        print(f"Job {name} finished: {context.progress}")
+        return True
+
+    async def trigger(self, name: str):
+        """Make a job due now; whichever worker takes the lease first runs it"""
+        db = get_database()
+        await db.jobs.update_one(
+            {"_id": name},
+            {"$set": {"next_run_at": datetime.utcnow()}},
+            upsert=True
+        )
+        self._wake.set()
+
+    async def _run(self):
+        while True:
+            for name in self._jobs:
+                try:
+                    await self.run_job(name)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    print(f"Error running job {name}: {e}")
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def status(self) -> list:
+        db = get_database()
+        jobs = {job["_id"]: job for job in await db.jobs.find({"_id": {"$in": self.job_names}}).to_list(length=None)}
+        now = datetime.utcnow()
+        result = []
+        for name, job in self._jobs.items():
+            state = jobs.get(name, {})
+            lease_until = state.get("lease_until")
+            result.append({
+                "name": name,
+                "interval_seconds": job["interval"],
+                "running": bool(lease_until and lease_until > now),
+                "owner": state.get("owner"),
+                "progress": state.get("progress") or {},
+                "last_started_at": state.get("last_started_at"),
+                "last_finished_at": state.get("last_finished_at"),
+                "last_result": state.get("last_result"),
+                "last_error": state.get("last_error"),
+                "next_run_at": state.get("next_run_at")
+            })
+        return result
+
+scheduler = Scheduler(
+    settings.SCHEDULER_POLL_SECONDS,
+    settings.JOB_LEASE_SECONDS,
+    settings.JOB_BATCH_PAUSE_SECONDS
+)
@@ -0,0 +1,219 @@
+import asyncio
+import heapq
+import math
+import re
+import unicodedata
+from bisect import bisect_left, insort
+from collections import Counter
+from database import get_database
+
+# 中日韩文字范围：按单字 + 二元组切分，其他文字按单词切分
+_CJK = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af"
+_WORD_RE = re.compile(r"[^\W_]+")
+_SEGMENT_RE = re.compile(f"[{_CJK}]+|[^{_CJK}]+")
+_CJK_RE = re.compile(f"[{_CJK}]")
+
+NAME_WEIGHT = 3.0
+DESCRIPTION_WEIGHT = 1.0
+PREFIX_FACTOR = 0.5
+# 前缀过短时可能匹配大量词项，限制展开数量
+MAX_PREFIX_EXPANSION = 64
+MAX_RESULTS = 1000
+
+def _segments(text: str):
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    for word in _WORD_RE.findall(text):
+        for segment in _SEGMENT_RE.findall(word):
+            yield segment, bool(_CJK_RE.match(segment))
+
+def tokenize(text: str) -> list:
+    """Split text into index terms: words for alphabetic text, unigrams and bigrams for CJK"""
+    tokens = []
+    for segment, is_cjk in _segments(text):
+        if is_cjk:
+            tokens.extend(segment)
+            tokens.extend(segment[i:i + 2] for i in range(len(segment) - 1))
+        else:
+            tokens.append(segment)
+    return tokens
+
+class ProductSearchIndex:
+    """In-process inverted index over product name and description.
+
+    Every worker process keeps its own copy: it is built from MongoDB at startup
+    and kept in sync by the product write endpoints of that process. Writes
+    handled by other workers only show up here at the next rebuild, so with
+    several workers `start(refresh_seconds)` rebuilds the index periodically;
+    between rebuilds a worker may serve results that are that much out of date.
+    """
+
+    def __init__(self):
+        self._reset()
+        self._replay = None
+        self._task = None
+
+    def _reset(self):
+        self.ready = False
+        self._postings = {}
+        self._doc_terms = {}
+        self._status = {}
+        self._sorted_terms = []
+
+    def __len__(self):
+        return len(self._doc_terms)
+
+    async def rebuild(self):
+        """Load every product from MongoDB into a fresh index and swap it in.
+
+        The current index keeps serving while the new one is built; writes
+        made in the meantime are replayed onto the new one before the swap.
+        """
+        db = get_database()
+        fresh = ProductSearchIndex()
+        # 批量构建时不逐个维护有序词表，最后统一排序
+        fresh._sorted_terms = None
+        self._replay = []
+        try:
+            cursor = db.products.find({}, {"name": 1, "description": 1, "status": 1})
+            async for product in cursor:
+                fresh.add(product)
+        except Exception as e:
+            # 构建失败时保留现有索引；从未建成时 ready=False，搜索退回正则匹配
+            print(f"Error building search index: {e}")
+            self._replay = None
+            return
+        fresh._sorted_terms = sorted(fresh._postings)
+        for method, args in self._replay:
+            getattr(fresh, method)(*args)
+        self._replay = None
+        self._postings = fresh._postings
+        self._doc_terms = fresh._doc_terms
+        self._status = fresh._status
+        self._sorted_terms = fresh._sorted_terms
+        self.ready = True
+        print(f"Search index built with {len(self)} products")
+
+    async def _refresh(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            await self.rebuild()
+
+    def start(self, refresh_seconds: float):
+        """Rebuild every refresh_seconds (0 = never) to pick up other workers' writes"""
+        if refresh_seconds and self._task is None:
+            self._task = asyncio.create_task(self._refresh(refresh_seconds))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def add(self, product: dict):
+        if self._replay is not None:
+            self._replay.append(("add", (product,)))
+        product_id = str(product["_id"])
+        self._remove(product_id)
+
+        weights = Counter()
+        for term in tokenize(product.get("name", "")):
+            weights[term] += NAME_WEIGHT
+        for term in tokenize(product.get("description", "")):
+            weights[term] += DESCRIPTION_WEIGHT
+
+        for term, weight in weights.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                if self._sorted_terms is not None:
+                    insort(self._sorted_terms, term)
+            postings[product_id] = weight
+        self._doc_terms[product_id] = list(weights)
+        self._status[product_id] = product.get("status", "pending")
+
+    def remove(self, product_id: str):
+        if self._replay is not None:
+            self._replay.append(("remove", (product_id,)))
+        self._remove(product_id)
+
+    def _remove(self, product_id: str):
+        for term in self._doc_terms.pop(product_id, []):
+            postings = self._postings[term]
+            postings.pop(product_id, None)
+            if not postings:
+                del self._postings[term]
+                del self._sorted_terms[bisect_left(self._sorted_terms, term)]
+        self._status.pop(product_id, None)
+
+    def set_status(self, product_id: str, status: str):
+        if self._replay is not None:
+            self._replay.append(("set_status", (product_id, status)))
+        if product_id in self._status:
+            self._status[product_id] = status
+
+    def _query_groups(self, text: str) -> list:
+        # 每个查询词对应一组候选词项 (term, factor)，文档需命中所有组
+        groups = []
+        for segment, is_cjk in _segments(text):
+            if is_cjk:
+                if len(segment) == 1:
+                    groups.append([(segment, 1.0)])
+                else:
+                    groups.extend([(segment[i:i + 2], 1.0)] for i in range(len(segment) - 1))
+                continue
+            group = [(segment, 1.0)] if segment in self._postings else []
+            start = bisect_left(self._sorted_terms, segment)
+            for term in self._sorted_terms[start:start + MAX_PREFIX_EXPANSION + 1]:
+                if not term.startswith(segment):
+                    break
+                if term != segment:
+                    group.append((term, PREFIX_FACTOR))
+            groups.append(group)
+        return groups
+
+    def _group_size(self, group: list) -> int:
+        return sum(len(self._postings.get(term, ())) for term, _ in group)
+
+    def search(self, text: str, status: str = None, limit: int = MAX_RESULTS) -> list:
+        """Return product ids ranked by relevance, best first"""
+        groups = self._query_groups(text)
+        if not groups:
+            return []
+
+        total = max(len(self._doc_terms), 1)
+        scores = None
+        for group in sorted(groups, key=self._group_size):
+            group_scores = {}
+            # 状态过滤放在最小的一组里完成，后续各组只在候选集中计算
+            status_filter = status if scores is None else None
+            for term, factor in group:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + total / len(postings))
+                # 已有候选集较小时，遍历候选集而不是整条倒排链
+                if scores is not None and len(scores) < len(postings):
+                    matches = ((pid, postings[pid]) for pid in scores if pid in postings)
+                else:
+                    matches = postings.items()
+                for product_id, weight in matches:
+                    if scores is not None and product_id not in scores:
+                        continue
+                    if status_filter is not None and self._status.get(product_id) != status_filter:
+                        continue
+                    score = weight * factor * idf
+                    if score > group_scores.get(product_id, 0):
+                        group_scores[product_id] = score
+            if scores is None:
+                scores = group_scores
+            else:
+                scores = {pid: scores[pid] + score for pid, score in group_scores.items()}
+            if not scores:
+                return []
+
+        return [pid for pid, _ in heapq.nlargest(limit, scores.items(), key=lambda item: item[1])]
+
+search_index = ProductSearchIndex()
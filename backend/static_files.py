@@ -0,0 +1,127 @@
+import os
+import re
+from collections import OrderedDict
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from config import settings
+
+# 上传文件名唯一（内容哈希或 uuid），同一 URL 的内容永远不变
+_CONTENT_HASH_RE = re.compile(r"^[0-9a-f]{64}$")
+_UNIQUE_STEM_RE = re.compile(r"^([0-9a-f]{64}|[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})(_w\d+)?$")
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+DEFAULT_CACHE_CONTROL = "public, max-age=3600"
+
+class HotFileCache:
+    """Keeps the bytes of small, repeatedly requested files in memory.
+
+    A file is admitted on its second request, and the least recently used
+    entries are dropped once `max_bytes` is exceeded. Entries are keyed by
+    path, size and mtime, so a replaced file is never served stale.
+    """
+
+    def __init__(self, max_bytes: int, max_file_bytes: int):
+        self.max_bytes = max_bytes
+        self.max_file_bytes = max_file_bytes
+        self._files = OrderedDict()
+        self._seen = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        content = self._files.get(key)
+        if content is None:
+            self.misses += 1
+            return None
+        self._files.move_to_end(key)
+        self.hits += 1
+        return content
+
+    def admit(self, key, path: str, file_size: int):
+        """Read the file into the cache if it is small and has been requested before"""
+        if file_size > self.max_file_bytes or file_size > self.max_bytes:
+            return None
+        if key not in self._seen:
+            self._seen[key] = True
+            # 只记录有限数量的“见过一次”，防止一次性请求撑大内存
+            while len(self._seen) > 4096:
+                self._seen.popitem(last=False)
+            return None
+        del self._seen[key]
+        # 文件很小（默认不超过 256 KB），且通常已在页缓存中，直接同步读取
+        with open(path, "rb") as f:
+            content = f.read()
+        self._files[key] = content
+        self.size += len(content)
+        while self.size > self.max_bytes:
+            _, evicted = self._files.popitem(last=False)
+            self.size -= len(evicted)
+        return content
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "files": len(self._files),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0
+        }
+
+def cache_headers(filename: str) -> dict:
+    stem, _ = os.path.splitext(filename)
+    if not _UNIQUE_STEM_RE.match(stem):
+        return {"cache-control": DEFAULT_CACHE_CONTROL}
+    headers = {"cache-control": IMMUTABLE_CACHE_CONTROL}
+    if _CONTENT_HASH_RE.match(stem):
+        # 原图以内容哈希命名，哈希本身就是强 ETag
+        headers["etag"] = f'"{stem}"'
+    return headers
+
+class UploadStaticFiles(StaticFiles):
+    """StaticFiles for /uploads with long-lived caching.
+
+    Upload names never get reused, so those responses are marked immutable and
+    content-addressed originals use their hash as a strong ETag. Starlette
+    answers If-None-Match / If-Modified-Since with 304, serves byte ranges, and
+    uses sendfile when the server supports `http.response.pathsend`. An
+    optional HotFileCache serves the hottest small images from memory.
+    """
+
+    def __init__(self, *args, hot_cache: HotFileCache = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.hot_cache = hot_cache
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope, status_code: int = 200) -> Response:
+        request_headers = Headers(scope=scope)
+        headers = cache_headers(os.path.basename(full_path))
+
+        response = FileResponse(full_path, status_code=status_code, headers=headers, stat_result=stat_result)
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+
+        # Range 请求交给 FileResponse 处理
+        if self.hot_cache is None or status_code != 200 or "range" in request_headers:
+            return response
+
+        key = (str(full_path), stat_result.st_size, stat_result.st_mtime)
+        content = self.hot_cache.get(key)
+        if content is None:
+            content = self.hot_cache.admit(key, full_path, stat_result.st_size)
+        if content is None:
+            return response
+        return Response(
+            content,
+            status_code=status_code,
+            headers={name: value for name, value in response.headers.items() if name != "content-length"},
+            media_type=response.media_type
+        )
+
+# 默认关闭；STATIC_HOT_CACHE_BYTES > 0 时启用
+upload_hot_cache = (
+    HotFileCache(settings.STATIC_HOT_CACHE_BYTES, settings.STATIC_HOT_CACHE_MAX_FILE_BYTES)
+    if settings.STATIC_HOT_CACHE_BYTES > 0 else None
+)
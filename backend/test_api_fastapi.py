@@ -1,5 +1,9 @@
+import uuid
+from bson import ObjectId
+from pymongo import MongoClient
 from fastapi.testclient import TestClient
 from main import app
+from config import settings
 
 client = TestClient(app)
 
@@ -38,5 +42,60 @@ def test_api_endpoints():
     print(f"   Status: {response.status_code}")
     print(f"   Response: {response.text}")
 
+def test_bulk_moderate_pending_filter():
+    print("=== Testing bulk moderation of new products ===")
+    
+    tag = f"bulk-moderate-{uuid.uuid4().hex[:8]}"
+    db = MongoClient(settings.MONGODB_URI).cozshop
+    # 启动应用（建索引、回填字段），请求结束后清理测试数据
+    with TestClient(app) as client:
+        tokens = {}
+        for role in ("seller", "admin"):
+            response = client.post("/api/auth/register", json={
+                "name": f"{tag}-{role}",
+                "email": f"{tag}-{role}@example.com",
+                "password": "password123"
+            })
+            assert response.status_code == 201, response.text
+            tokens[role] = response.json()["access_token"]
+        db.users.update_one({"_id": ObjectId(tokens["admin"])}, {"$set": {"role": "admin"}})
+        
+        try:
+            product_ids = []
+            for index in range(3):
+                response = client.post(
+                    "/api/products",
+                    data={
+                        "name": f"{tag} {index}", "description": "imported", "price": "10",
+                        "category": tag, "stock": "1", "condition": "new",
+                        "tradeMethod": "delivery", "tradeAddress": "n/a"
+                    },
+                    headers={"Authorization": f"Bearer {tokens['seller']}"}
+                )
+                assert response.status_code == 201, response.text
+                assert response.json()["status"] == "pending"
+                product_ids.append(response.json()["id"])
+            
+            # 新建的商品要能被 status=pending 的筛选条件选中
+            response = client.post(
+                "/api/products/bulk-moderate",
+                json={"filter": {"status": "pending", "category": tag}, "status": "approved"},
+                headers={"Authorization": f"Bearer {tokens['admin']}"}
+            )
+            print(f"   Status: {response.status_code}")
+            print(f"   Response: {response.text}")
+            assert response.status_code == 200, response.text
+            result = response.json()
+            assert result["matched"] == 3
+            assert result["updated_count"] == 3
+            assert result["remaining"] is False
+            approved = db.products.count_documents({"category": tag, "status": "approved"})
+            assert approved == 3
+        finally:
+            for product in db.products.find({"category": tag}, {"_id": 1}):
+                client.delete(f"/api/products/{product['_id']}", headers={"Authorization": f"Bearer {tokens['admin']}"})
+            db.users.delete_many({"_id": {"$in": [ObjectId(token) for token in tokens.values()]}})
+
 if __name__ == "__main__":
     test_api_endpoints()
+    test_bulk_moderate_pending_filter()
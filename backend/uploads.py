@@ -0,0 +1,275 @@
+import asyncio
+import glob
+import hashlib
+import os
+import re
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import List
+from fastapi import HTTPException, UploadFile, status
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from config import settings
+from database import get_database
+
+UPLOAD_DIR = "uploads"
+UPLOAD_URL_PREFIX = "/uploads/"
+CHUNK_SIZE = 1024 * 1024
+# 表单里图片以外的字段与 multipart 分隔符的余量
+FORM_OVERHEAD_BYTES = 1024 * 1024
+# 回收标记超过这个时间仍在，视为回收的进程已退出
+REMOVAL_TIMEOUT_SECONDS = 60
+
+# 确保上传目录存在
+os.makedirs(UPLOAD_DIR, exist_ok=True)
+
+# 扩展名只保留字母数字，避免奇怪的文件名进入上传目录
+_EXTENSION_RE = re.compile(r"^\.[A-Za-z0-9]{1,10}$")
+# 按内容哈希命名的文件（sha256 + 扩展名）；旧的 uuid 文件名不做引用计数
+_CONTENT_NAME_RE = re.compile(r"^[0-9a-f]{64}(\.[a-z0-9]{1,10})?$")
+
+class UploadTooLarge(Exception):
+    pass
+
+def _request_too_large() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"Images exceed {settings.UPLOAD_MAX_REQUEST_BYTES} bytes in total"
+    )
+
+class UploadLimitMiddleware:
+    """Caps multipart request bodies while they are received.
+
+    A declared Content-Length over the cap is refused before any of the body
+    is read; otherwise bytes are counted as they arrive and the request fails
+    with 413 as soon as it goes over, so an oversized upload is never spooled
+    in full. The cap is UPLOAD_MAX_REQUEST_BYTES plus room for the text fields.
+    """
+
+    def __init__(self, app, max_bytes: int):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        if not headers.get("content-type", "").startswith("multipart/form-data"):
+            await self.app(scope, receive, send)
+            return
+
+        content_length = headers.get("content-length", "")
+        if content_length.isdigit() and int(content_length) > self.max_bytes:
+            error = _request_too_large()
+            response = JSONResponse({"detail": error.detail}, status_code=error.status_code)
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                # 在表单解析途中抛出，FastAPI 原样转成 413 响应
+                if received > self.max_bytes:
+                    raise _request_too_large()
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+def _extension(filename: str) -> str:
+    extension = os.path.splitext(filename or "")[1]
+    return extension.lower() if _EXTENSION_RE.match(extension) else ""
+
+def _hash(source, max_bytes: int) -> tuple:
+    """sha256 and size of a file object, stopping past max_bytes; runs in a worker thread"""
+    digest = hashlib.sha256()
+    size = 0
+    source.seek(0)
+    while True:
+        chunk = source.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > max_bytes:
+            raise UploadTooLarge()
+        digest.update(chunk)
+    return digest.hexdigest(), size
+
+def _copy(source, filename: str):
+    """Copy a file object into UPLOAD_DIR via a temp name; runs in a worker thread"""
+    # 临时名各不相同：同一内容被并发写入时互不干扰，最后一次 rename 生效
+    temp_path = os.path.join(UPLOAD_DIR, f".{filename}.{uuid.uuid4().hex}.tmp")
+    try:
+        source.seek(0)
+        with open(temp_path, "wb") as f:
+            while True:
+                chunk = source.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                f.write(chunk)
+        os.replace(temp_path, os.path.join(UPLOAD_DIR, filename))
+    except BaseException:
+        _remove(temp_path)
+        raise
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def _remove_variants(filename: str):
+    stem = os.path.splitext(filename)[0]
+    for path in glob.glob(os.path.join(UPLOAD_DIR, f"{glob.escape(stem)}_w*")):
+        _remove(path)
+
+def _remove_stored(filename: str):
+    # 原图连同它的缩略图 / WebP 变体一起删除
+    _remove(os.path.join(UPLOAD_DIR, filename))
+    _remove_variants(filename)
+
+def _stored_name(url: str):
+    if not url or not url.startswith(UPLOAD_URL_PREFIX):
+        return None
+    filename = url[len(UPLOAD_URL_PREFIX):]
+    return filename if _CONTENT_NAME_RE.match(filename) else None
+
+def upload_refs(product: dict) -> list:
+    """Content-addressed uploads a product references, one entry per reference"""
+    urls = list(product.get("images") or [])
+    if product.get("image") not in urls:
+        urls.append(product.get("image"))
+    return [name for name in map(_stored_name, urls) if name]
+
+async def _acquire(filename: str):
+    """Add one reference to a stored file; returns its record from before, None if it had none"""
+    db = get_database()
+    update = {"$inc": {"refs": 1}, "$setOnInsert": {"created_at": datetime.utcnow()}}
+    try:
+        return await db.uploads.find_one_and_update(
+            {"_id": filename}, update, upsert=True, return_document=ReturnDocument.BEFORE
+        )
+    except DuplicateKeyError:
+        # 并发上传同一内容时只有一个 upsert 能插入，另一个重试即为普通自增
+        return await db.uploads.find_one_and_update(
+            {"_id": filename}, update, upsert=True, return_document=ReturnDocument.BEFORE
+        )
+
+def _removal_pending(now: datetime) -> dict:
+    return {"removing_at": {"$gte": now - timedelta(seconds=REMOVAL_TIMEOUT_SECONDS)}}
+
+async def _wait_for_removal(filename: str):
+    """Wait until a release that is deleting this file has finished"""
+    db = get_database()
+    while await db.uploads.find_one({"_id": filename, **_removal_pending(datetime.utcnow())}, {"_id": 1}):
+        await asyncio.sleep(0.05)
+
+async def acquire_uploads(filenames: list):
+    counts = Counter(filenames)
+    if not counts:
+        return
+    db = get_database()
+    await db.uploads.bulk_write([
+        UpdateOne({"_id": name}, {"$inc": {"refs": count}, "$setOnInsert": {"created_at": datetime.utcnow()}}, upsert=True)
+        for name, count in counts.items()
+    ], ordered=False)
+
+async def release_uploads(filenames: list):
+    """Drop references and delete files nobody references any more"""
+    counts = Counter(filenames)
+    if not counts:
+        return
+    db = get_database()
+    await db.uploads.bulk_write([
+        UpdateOne({"_id": name}, {"$inc": {"refs": -count}})
+        for name, count in counts.items()
+    ], ordered=False)
+    for name in counts:
+        # 先给记录打上回收标记再删文件，记录删掉之前同一内容的上传会等回收结束再写文件；
+        # 期间被重新引用（refs > 0）的记录保留下来，只去掉标记
+        now = datetime.utcnow()
+        token = uuid.uuid4().hex
+        claimed = await db.uploads.find_one_and_update(
+            {"_id": name, "refs": {"$lte": 0}, "$nor": [_removal_pending(now)]},
+            {"$set": {"removing": token, "removing_at": now}}
+        )
+        if not claimed:
+            continue
+        await run_in_threadpool(_remove_stored, name)
+        result = await db.uploads.delete_one({"_id": name, "removing": token, "refs": {"$lte": 0}})
+        if not result.deleted_count:
+            await db.uploads.update_one({"_id": name, "removing": token}, {"$unset": {"removing": "", "removing_at": ""}})
+
+async def discard_variants(urls: list):
+    """Delete variants built for uploads that are no longer referenced.
+
+    Covers variants generated while their original was being released, which
+    the release itself could not see yet.
+    """
+    db = get_database()
+    for name in filter(None, map(_stored_name, urls)):
+        if not await db.uploads.find_one({"_id": name, "refs": {"$gt": 0}}, {"_id": 1}):
+            await run_in_threadpool(_remove_variants, name)
+
+async def save_upload(upload: UploadFile, max_bytes: int) -> tuple:
+    """Store one upload under its content hash and return (url, size).
+
+    Takes a reference on the stored file. Bytes that are already stored are
+    not written again; new files go to a temporary name first and are renamed
+    into place once complete, so a half-written file is never served.
+    """
+    # multipart 解析时已记录大小，明显超限的文件不必再读
+    if upload.size is not None and upload.size > max_bytes:
+        raise UploadTooLarge()
+
+    digest, size = await run_in_threadpool(_hash, upload.file, max_bytes)
+    filename = f"{digest}{_extension(upload.filename)}"
+    # 先登记引用再写文件：引用在，回收就不会开始；已经开始的回收要等它删完文件再写
+    previous = await _acquire(filename)
+    try:
+        if previous is not None and previous.get("removing"):
+            await _wait_for_removal(filename)
+        if previous is None or not os.path.exists(os.path.join(UPLOAD_DIR, filename)):
+            await run_in_threadpool(_copy, upload.file, filename)
+    except BaseException:
+        await release_uploads([filename])
+        raise
+    return f"{UPLOAD_URL_PREFIX}{filename}", size
+
+async def save_uploads(uploads: List[UploadFile], max_files: int = 5) -> List[str]:
+    """Save up to max_files uploads and return their URLs, one reference each.
+
+    Each file is capped at UPLOAD_MAX_FILE_BYTES and the request as a whole at
+    UPLOAD_MAX_REQUEST_BYTES; going over either rejects the request with 413
+    and removes what was already saved for it. Other I/O errors skip the image.
+    These checks run on files Starlette has already spooled, so the size of
+    the body itself is bounded earlier by UploadLimitMiddleware.
+    """
+    urls = []
+    remaining = settings.UPLOAD_MAX_REQUEST_BYTES
+    for upload in uploads[:max_files]:
+        max_bytes = min(settings.UPLOAD_MAX_FILE_BYTES, remaining)
+        try:
+            url, written = await save_upload(upload, max_bytes)
+        except UploadTooLarge:
+            await release_uploads([_stored_name(saved_url) for saved_url in urls])
+            if max_bytes != settings.UPLOAD_MAX_FILE_BYTES:
+                raise _request_too_large()
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"Image {upload.filename} exceeds {settings.UPLOAD_MAX_FILE_BYTES} bytes"
+            )
+        except OSError as e:
+            print(f"Error saving image: {e}")
+            continue
+        urls.append(url)
+        remaining -= written
+    return urls
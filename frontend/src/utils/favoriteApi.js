@@ -4,7 +4,7 @@ export const favoriteApi = {
   // 获取用户的收藏列表
   getFavorites: async () => {
     try {
-      const response = await api.get('/favorites')
+      const response = await api.get('/favorites', { params: { compact: true } })
       return response.data
     } catch (error) {
       console.error('获取收藏列表失败:', error)
@@ -43,5 +43,16 @@ export const favoriteApi = {
       console.error('检查收藏状态失败:', error)
       throw error
     }
+  },
+  
+  // 批量检查收藏状态，返回 { 商品id: 是否已收藏 }
+  checkFavorites: async (productIds) => {
+    try {
+      const response = await api.post('/favorites/check', { product_ids: productIds })
+      return response.data.favorites
+    } catch (error) {
+      console.error('批量检查收藏状态失败:', error)
+      throw error
+    }
   }
 }
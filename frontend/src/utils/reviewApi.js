@@ -12,6 +12,28 @@ export const reviewApi = {
     }
   },
   
+  // 获取商品评价摘要（数量、平均分、星级分布、最新评价）
+  getReviewSummary: async (productId) => {
+    try {
+      const response = await api.get(`/reviews/product/${productId}/summary`)
+      return response.data
+    } catch (error) {
+      console.error('获取评价摘要失败:', error)
+      throw error
+    }
+  },
+  
+  // 标记评价有用
+  markHelpful: async (reviewId) => {
+    try {
+      const response = await api.post(`/reviews/${reviewId}/helpful`)
+      return response.data
+    } catch (error) {
+      console.error('标记评价失败:', error)
+      throw error
+    }
+  },
+  
   // 创建评价
   createReview: async (reviewData) => {
     try {